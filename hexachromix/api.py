@@ -1,10 +1,43 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+
+import psutil
+from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Union, Literal
+
+from . import search, session, solver, metrics
+from .cache import ResultCache
+from .book import Book
+from .core import HexachromixState, COUNTERS
 
-from multimcts import MCTS
 
-from .core import HexachromixState
+# Settings, from the environment.
+WORKERS = int(os.environ.get('HEXACHROMIX_WORKERS', os.cpu_count() or 1)) # Size of the search process pool.
+MAX_QUEUE = int(os.environ.get('HEXACHROMIX_MAX_QUEUE', 4*WORKERS)) # Searches queued or running before requests get a 429.
+MAX_TIME = float(os.environ.get('HEXACHROMIX_MAX_TIME', 10)) # Per-search time limit (seconds).
+MAX_ITERATIONS = int(os.environ.get('HEXACHROMIX_MAX_ITERATIONS', 1_000_000)) # Per-search iteration limit.
+JOB_TTL = float(os.environ.get('HEXACHROMIX_JOB_TTL', 600)) # How long finished jobs are kept (seconds).
+CACHE_MB = float(os.environ.get('HEXACHROMIX_CACHE_MB', 64)) # Memory for cached analyses (0 to keep none in memory).
+CACHE_PATH = os.environ.get('HEXACHROMIX_CACHE_PATH') # SQLite file to persist cached analyses in, if any.
+BOOK_PATH = os.environ.get('HEXACHROMIX_BOOK') # Opening book to answer /best/ from, if any.
+SOLVER_EMPTY = int(os.environ.get('HEXACHROMIX_SOLVER_EMPTY', 1)) # /best/ tries the exact solver when at most this many cells are empty (-1 to never).
+SOLVER_TIME = float(os.environ.get('HEXACHROMIX_SOLVER_TIME', 1)) # Solver time limit (seconds), also kept under half the search budget.
+COUNT = os.environ.get('HEXACHROMIX_COUNTERS', '0') == '1' # Enable the core hot-path counters (exposed in /metrics).
+SESSION_WORKERS = int(os.environ.get('HEXACHROMIX_SESSION_WORKERS', 1)) # Processes holding session trees.
+SESSION_TTL = float(os.environ.get('HEXACHROMIX_SESSION_TTL', 600)) # How long idle sessions are kept (seconds).
+SESSION_MAX_NODES = int(os.environ.get('HEXACHROMIX_SESSION_MAX_NODES', 2_000_000)) # Total tree nodes kept across sessions.
+STREAM_POLL = 0.01 # How often streams check for new updates (seconds).
 
 
 class MCTSParams(BaseModel):
@@ -12,55 +45,465 @@ class MCTSParams(BaseModel):
     rave_bias: float = 1
     max_iterations: Optional[int] = None
     max_time: Optional[float] = None
+    workers: int = 1
 
 class MCTSNode(BaseModel):
     hfen: str
     visits: int
     reward: float
 
+class Solution(BaseModel):
+    result: Optional[Literal['win','draw','loss']] # For the team to move. None if not proven.
+    hfen: Optional[str] # After the best move.
+    plies: int # How far ahead the solver looked.
+    nodes: int
+
+class JobRequest(BaseModel):
+    hfen: str = '3/4/5/4/3 R MRY'
+    kind: Literal['best','analysis'] = 'analysis'
+    mcts_params: MCTSParams = MCTSParams()
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: Literal['queued','running','done','failed','cancelled']
+    result: Optional[Union[str,List[MCTSNode]]] = None
+    error: Optional[str] = None
+
+class SessionRequest(BaseModel):
+    hfen: str = '3/4/5/4/3 R MRY'
+    mcts_params: MCTSParams = MCTSParams() # The biases are kept for the session. If a budget is given, the first search starts right away.
+
+class SessionSearch(BaseModel):
+    max_iterations: Optional[int] = None
+    max_time: Optional[float] = None
+
+class SessionMove(BaseModel):
+    hfen: Optional[str] = None # The state after the move. The session plays its best move if not given.
+
+class Session(BaseModel):
+    id: str
+    hfen: str
+    visits: int
+    nodes: int
+    children: List[MCTSNode]
+
+
+pool: Optional[ProcessPoolExecutor] = None
+pool_args = {} # Arguments for new process pools, set at startup.
+cache: Optional[ResultCache] = None
+book: Optional[Book] = None
+manager = None # Started on first use; shares queues and events with streaming searches.
+active = set() # Futures that are queued or running.
+jobs = {} # id -> (kind, futures, task, time finished or None)
+cancelled = set() # IDs of cancelled jobs. Searches that had already started run to their budget, but their results are discarded.
+session_pools: List[ProcessPoolExecutor] = [] # One process each, since a session's tree lives in the process that created it.
+sessions = {} # id -> [session pool index, time last used, nodes]
+counter_slots = None # Shared core counters: one slot for this process, then one per worker.
+latency = metrics.Histogram('hexachromix_request_duration_seconds', 'Request latency (until the response starts).', [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10], label='path')
+search_rate = metrics.Histogram('hexachromix_search_iterations_per_second', 'MCTS iterations per second of each /best/ and /analysis/ search.', [1000, 2500, 5000, 10000, 25000, 50000, 100000])
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    global pool, pool_args, cache, book, counter_slots
+    context = multiprocessing.get_context('spawn')
+    pool_args = {'mp_context':context}
+    if COUNT:
+        counter_slots = context.Array('Q', (1 + WORKERS + SESSION_WORKERS)*len(COUNTERS), lock=False)
+        metrics.use_slot(counter_slots, 0)
+        pool_args.update(initializer=metrics.init_worker, initargs=(counter_slots, context.Value('i', 1)))
+    pool = new_pool(WORKERS)
+    cache = ResultCache(int(CACHE_MB*2**20), CACHE_PATH)
+    book = Book(BOOK_PATH) if BOOK_PATH else None
+    session_pools[:] = [new_pool(1) for _ in range(SESSION_WORKERS)]
+    yield
+    pool.shutdown(wait=False, cancel_futures=True)
+    for session_pool in session_pools:
+        session_pool.shutdown(wait=False, cancel_futures=True)
+    sessions.clear()
+    cache.close()
+    if book is not None:
+        book.close()
+    if manager is not None:
+        manager.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+@app.middleware('http')
+async def time_request(request:Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    latency.observe(time.perf_counter() - start, route.path if route else 'unmatched')
+    return response
 
-@app.get("/best/", description="Analyzes the game state and returns the HFEN of the best move.")
-async def get_best(hfen:str='3/4/5/4/3 R MRY', mcts_params:MCTSParams=Depends(MCTSParams)):
+
+def new_pool(workers:int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, **pool_args)
+
+def check_limits(max_iterations:Optional[int], max_time:Optional[float]):
+    if max_iterations is None and max_time is None:
+        raise HTTPException(status_code=400, detail='At least one of [max_iterations,max_time] is required.')
+    if max_iterations is not None and max_iterations < 0:
+        raise HTTPException(status_code=400, detail='Invalid max_iterations. Must be non-negative.')
+    if max_time is not None and not max_time > 0:
+        raise HTTPException(status_code=400, detail='Invalid max_time. Must be positive.')
+
+def budget(hfen:str, mcts_params:MCTSParams) -> dict:
+    """Validate the request and return the search arguments, with the budget capped so no search holds a worker for long."""
+    if not 1 <= mcts_params.workers <= WORKERS:
+        raise HTTPException(status_code=400, detail=f'Invalid workers. Must be in range [1,{WORKERS}].')
     try:
-        mcts = MCTS(exploration_bias=mcts_params.exploration_bias, rave_bias=mcts_params.rave_bias)
         state = HexachromixState(hfen=hfen)
-        state = mcts.search(state, max_iterations=mcts_params.max_iterations, max_time=mcts_params.max_time)
-        return state.hfen
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if state.is_terminal():
+        raise HTTPException(status_code=400, detail='The game is over.')
+    check_limits(mcts_params.max_iterations, mcts_params.max_time)
+    return {
+        'exploration_bias': mcts_params.exploration_bias,
+        'rave_bias': mcts_params.rave_bias,
+        'max_iterations': MAX_ITERATIONS if mcts_params.max_iterations is None else min(mcts_params.max_iterations, MAX_ITERATIONS),
+        'max_time': MAX_TIME if mcts_params.max_time is None else min(mcts_params.max_time, MAX_TIME),
+    }
+
+def check_queue(workers:int):
+    if len(active) + workers > MAX_QUEUE:
+        raise HTTPException(status_code=429, detail='Too many searches in progress. Try again later.')
+
+def track(future:Future) -> Future:
+    """Count the future towards the queue depth until it is done."""
+    active.add(future)
+    future.add_done_callback(active.discard)
+    return future
+
+def submit_search(fn, *args, **kwargs) -> Future:
+    """Queue fn in the search pool and track it. A pool broken by a crashed worker is replaced first."""
+    global pool
+    try:
+        return track(pool.submit(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        pool.shutdown(wait=False)
+        pool = new_pool(WORKERS)
+        return track(pool.submit(fn, *args, **kwargs))
+
+async def results(futures:List[Future]) -> list:
+    """Wait for the futures. A ValueError means a bad request, and a crashed worker is a server error."""
+    try:
+        return await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokenProcessPool:
+        raise HTTPException(status_code=500, detail='A search process crashed.')
+
+def submit(kind:str, hfen:str, mcts_params:MCTSParams) -> List[Future]:
+    """Queue the request's searches in the process pool (one per worker)."""
+    kwargs = budget(hfen, mcts_params)
+    check_queue(mcts_params.workers)
+    if mcts_params.workers == 1:
+        fn = {'best':search.best, 'analysis':search.analysis}[kind]
+        return [submit_search(fn, hfen, **kwargs)]
+    # Root parallelization: independent searches whose results are merged.
+    seed = random.getrandbits(32)
+    return [submit_search(search.analysis, hfen, seed=seed+i, **kwargs) for i in range(mcts_params.workers)]
+
+async def gather(kind:str, futures:List[Future]):
+    """Wait for the searches and combine their results."""
+    analyses = await results(futures)
+    if len(analyses) == 1:
+        return analyses[0]
+    children = search.merge(analyses)
+    return search.best_of(children) if kind == 'best' else children
+
+async def cached_analysis(hfen:str, mcts_params:MCTSParams) -> List[dict]:
+    """The analysis, from the cache if a search with at least the requested budget was cached.
+    Otherwise, only the rest of the budget is searched and merged with the cached analysis.
+    """
+    kwargs = budget(hfen, mcts_params)
+    workers = mcts_params.workers
+    key = ResultCache.key(HexachromixState(hfen=hfen).to_bytes(), mcts_params.exploration_bias, mcts_params.rave_bias)
+    # Effort is counted over all workers, since their results are merged.
+    (iterations, seconds) = (kwargs['max_iterations']*workers, kwargs['max_time']*workers)
+    entry = cache.get(key, iterations, seconds)
+    if entry is not None and (entry[1] >= iterations or entry[2] >= seconds):
+        return entry[0]
+    (children, cached_iterations, cached_seconds) = entry or ([], 0, 0)
+    kwargs['max_iterations'] = -((cached_iterations - iterations)//workers)
+    kwargs['max_time'] = (seconds - cached_seconds)/workers
+    check_queue(workers)
+    seed = random.getrandbits(32) if workers > 1 else None
+    futures = [submit_search(search.timed_analysis, hfen, seed=None if seed is None else seed+i, **kwargs) for i in range(workers)]
+    analyses = await results(futures)
+    for (result, seconds) in analyses:
+        if seconds > 0:
+            search_rate.observe(sum(child['visits'] for child in result) / seconds)
+    children = search.merge([children] + [result[0] for result in analyses])
+    cache.put(key, children, sum(child['visits'] for child in children), cached_seconds + sum(result[1] for result in analyses))
+    return children
+
+
+async def solve(hfen:str, **kwargs) -> dict:
+    """Run the exact solver in the process pool (kwargs are passed to solver.solve)."""
+    check_queue(1)
+    return (await results([submit_search(solver.solve, hfen, **kwargs)]))[0]
+
+@app.get("/best/", description="Analyzes the game state and returns the HFEN of the best move. Positions in the opening book are answered from it unless use_book is false. Endgames are solved exactly if the solver proves the result in time.")
+async def get_best(hfen:str='3/4/5/4/3 R MRY', mcts_params:MCTSParams=Depends(MCTSParams), use_book:bool=True):
+    if book is not None and use_book:
+        try:
+            state = HexachromixState(hfen=hfen)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        record = book.probe(state)
+        if record is not None:
+            return state.make_move(record[0]).hfen
+    kwargs = budget(hfen, mcts_params)
+    state = HexachromixState(hfen=hfen)
+    if state.count_empty() <= SOLVER_EMPTY and not state.is_terminal():
+        solution = await solve(hfen, max_time=min(SOLVER_TIME, kwargs['max_time']/2))
+        if solver.decisive(solution, state):
+            return solution['hfen']
+    return search.best_of(await cached_analysis(hfen, mcts_params))
 
 @app.get("/analysis/", response_model=List[MCTSNode], description="Analyzes the game state and returns information about each legal move.")
 async def get_analysis(hfen:str='3/4/5/4/3 R MRY', mcts_params:MCTSParams=Depends(MCTSParams)):
+    return await cached_analysis(hfen, mcts_params)
+
+@app.get("/solve/", response_model=Solution, description="Searches for a proven win, draw or loss for the team to move, with the other teams playing together against it.")
+async def get_solve(hfen:str='3/4/5/4/3 R MRY', max_time:float=1, max_plies:int=32):
     try:
-        mcts = MCTS(exploration_bias=mcts_params.exploration_bias, rave_bias=mcts_params.rave_bias)
         state = HexachromixState(hfen=hfen)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if state.is_terminal():
+        raise HTTPException(status_code=400, detail='The game is over.')
+    return await solve(hfen, max_plies=max_plies, max_time=min(max_time, MAX_TIME))
+
+@app.get("/cache/", description="Returns the result cache's hit, extension and miss counts and its size.")
+async def get_cache():
+    return cache.stats()
+
+@app.get("/analysis/stream/", description="Streams the analysis of each legal move as Server-Sent Events, every every_iterations iterations and/or every_ms milliseconds, until the budget is spent or the client disconnects.")
+async def stream_analysis(hfen:str='3/4/5/4/3 R MRY', mcts_params:MCTSParams=Depends(MCTSParams), every_iterations:Optional[int]=None, every_ms:Optional[float]=100):
+    global manager
+    if mcts_params.workers != 1:
+        raise HTTPException(status_code=400, detail='Streaming does not support multiple workers.')
+    if every_iterations is None and every_ms is None:
+        raise HTTPException(status_code=400, detail='At least one of [every_iterations,every_ms] is required.')
+    if every_iterations is not None and every_iterations < 1:
+        raise HTTPException(status_code=400, detail='Invalid every_iterations. Must be positive.')
+    if every_ms is not None and not every_ms > 0:
+        raise HTTPException(status_code=400, detail='Invalid every_ms. Must be positive.')
+    kwargs = budget(hfen, mcts_params)
+    check_queue(1)
+    if manager is None:
+        manager = multiprocessing.get_context('spawn').Manager()
+    updates = manager.Queue()
+    stop = manager.Event()
+    future = submit_search(
+        search.stream_analysis, hfen, updates, stop,
+        every_iterations=every_iterations,
+        every_time=None if every_ms is None else every_ms/1000,
+        **kwargs,
+    )
+
+    async def events():
+        try:
+            # Poll rather than block a thread on the queue, so waiting streams don't hold threads.
+            while True:
+                try:
+                    children = updates.get_nowait()
+                except queue.Empty:
+                    # The search puts everything before it finishes, unless its process crashed.
+                    if future.done():
+                        break
+                    await asyncio.sleep(STREAM_POLL)
+                    continue
+                if children is None:
+                    break
+                yield f'event: analysis\ndata: {json.dumps(children)}\n\n'
+            try:
+                await asyncio.wrap_future(future)
+            except (ValueError, BrokenProcessPool) as e:
+                yield f'event: error\ndata: {json.dumps(str(e) or "A search process crashed.")}\n\n'
+                return
+            yield 'event: done\ndata: null\n\n'
+        finally:
+            # Also reached when the client disconnects, so the search stops using CPU.
+            stop.set()
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+
+def prune_jobs():
+    """Forget jobs that finished more than JOB_TTL seconds ago."""
+    now = time.time()
+    for id,(kind,futures,task,finished) in list(jobs.items()):
+        if finished is None and task.done():
+            jobs[id] = (kind, futures, task, now)
+        elif finished is not None and now - finished > JOB_TTL:
+            del jobs[id]
+            cancelled.discard(id)
+
+def job_info(id:str) -> Job:
+    if id not in jobs:
+        raise HTTPException(status_code=404, detail=f'Job {id} not found.')
+    (kind, futures, task, _) = jobs[id]
+    if task.cancelled() or id in cancelled:
+        return Job(id=id, kind=kind, status='cancelled')
+    if not task.done():
+        return Job(id=id, kind=kind, status='running' if any(f.running() or f.done() for f in futures) else 'queued')
+    if task.exception() is not None:
+        e = task.exception()
+        return Job(id=id, kind=kind, status='failed', error=str(e.detail if isinstance(e, HTTPException) else e))
+    return Job(id=id, kind=kind, status='done', result=task.result())
+
+@app.post("/jobs", response_model=Job, status_code=202, description="Queues a search and returns its job ID.")
+async def post_job(job:JobRequest):
+    prune_jobs()
+    futures = submit(job.kind, job.hfen, job.mcts_params)
+    id = uuid.uuid4().hex
+    jobs[id] = (job.kind, futures, asyncio.create_task(gather(job.kind, futures)), None)
+    return job_info(id)
+
+@app.get("/jobs/{id}", response_model=Job, description="Returns the status of a job, and its result once done.")
+async def get_job(id:str):
+    prune_jobs()
+    return job_info(id)
+
+@app.delete("/jobs/{id}", response_model=Job, description="Cancels a job. A search that has already started runs to its budget, but its result is discarded.")
+async def delete_job(id:str):
+    (kind, futures, task, finished) = jobs.get(id, (None, [], None, None))
+    if task is not None and not task.done():
+        for future in futures:
+            future.cancel()
+        task.cancel()
+        cancelled.add(id)
+        jobs[id] = (kind, futures, task, time.time())
+    return job_info(id)
+
 
-        # Find the best child node.
-        best = mcts.search(
-            state,
-            max_iterations=mcts_params.max_iterations,
-            max_time=mcts_params.max_time,
-            return_type='node',
-        )
-
-        # Back up to the parent, gather info about all children (best's siblings).
-        parent = best.get_parent()
-        children = [
-            MCTSNode(
-                hfen=n.get_state().hfen,
-                visits=n.get_visits(),
-                reward=n.get_avg_reward(),
-            )
-            for n in parent.get_children().values()
-        ]
-        # Sort by visits and reward.
-        children.sort(key=lambda n:(n.visits,n.reward), reverse=True)
-
-        return children
+def prune_sessions(keep:Optional[str]=None):
+    """Forget sessions idle for more than SESSION_TTL seconds, then the least recently used ones (other than keep) while the trees hold more than SESSION_MAX_NODES nodes."""
+    now = time.time()
+    for id,(_,last_used,_) in sorted(sessions.items(), key=lambda item:item[1][1]):
+        if id != keep and (now - last_used > SESSION_TTL or sum(nodes for (_,_,nodes) in sessions.values()) > SESSION_MAX_NODES):
+            drop_session(id)
+
+def drop_session(id:str):
+    (index, _, _) = sessions.pop(id)
+    try:
+        session_pools[index].submit(session.delete, id)
+    except BrokenProcessPool:
+        pass # The tree is gone already.
+
+async def call_session(id:str, fn, *args, **kwargs) -> dict:
+    """Run fn in the session's process and record its new size."""
+    if id not in sessions:
+        raise HTTPException(status_code=404, detail=f'Session {id} not found.')
+    index = sessions[id][0]
+    sessions[id][1] = time.time()
+    try:
+        info = await asyncio.wrap_future(track(session_pools[index].submit(fn, id, *args, **kwargs)))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except BrokenProcessPool:
+        # The sessions' trees died with the process.
+        session_pools[index].shutdown(wait=False)
+        session_pools[index] = new_pool(1)
+        for (other,(other_index,_,_)) in list(sessions.items()):
+            if other_index == index:
+                del sessions[other]
+        raise HTTPException(status_code=500, detail='The session process crashed. Its sessions were lost.')
+    if id in sessions:
+        sessions[id][1:] = [time.time(), info['nodes']]
+    prune_sessions(keep=id)
+    return info
+
+def session_budget(id:str, budget:Union[MCTSParams,SessionSearch]) -> dict:
+    """Validate a session search and cap its budget, including so the tree can't grow past SESSION_MAX_NODES (each iteration adds at most one node)."""
+    if id not in sessions:
+        raise HTTPException(status_code=404, detail=f'Session {id} not found.')
+    check_limits(budget.max_iterations, budget.max_time)
+    room = SESSION_MAX_NODES - sessions[id][2]
+    if room <= 0:
+        raise HTTPException(status_code=400, detail='Session is full. Play a move to release part of the tree.')
+    # Session searches wait behind each other in their process, so they count towards the queue too.
+    check_queue(1)
+    return {
+        'max_iterations': min(room, MAX_ITERATIONS if budget.max_iterations is None else budget.max_iterations),
+        'max_time': MAX_TIME if budget.max_time is None else min(budget.max_time, MAX_TIME),
+    }
+
+@app.post("/sessions", response_model=Session, status_code=201, description="Starts an analysis session, which keeps its search tree between requests.")
+async def post_session(request:SessionRequest):
+    if request.mcts_params.workers != 1:
+        raise HTTPException(status_code=400, detail='Sessions do not support multiple workers.')
+    try:
+        state = HexachromixState(hfen=request.hfen)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    searching = request.mcts_params.max_iterations is not None or request.mcts_params.max_time is not None
+    if searching:
+        if state.is_terminal():
+            raise HTTPException(status_code=400, detail='The game is over.')
+        check_limits(request.mcts_params.max_iterations, request.mcts_params.max_time)
+        check_queue(1)
+    prune_sessions()
+    id = uuid.uuid4().hex
+    counts = [0]*len(session_pools)
+    for (index,_,_) in sessions.values():
+        counts[index] += 1
+    sessions[id] = [counts.index(min(counts)), time.time(), 1]
+    info = await call_session(id, session.create, request.hfen, request.mcts_params.exploration_bias, request.mcts_params.rave_bias)
+    if searching:
+        info = await call_session(id, session.search, **session_budget(id, request.mcts_params))
+    return info
+
+@app.get("/sessions/{id}", response_model=Session, description="Returns the session's current state and analysis.")
+async def get_session(id:str):
+    prune_sessions(keep=id)
+    return await call_session(id, session.info)
+
+@app.post("/sessions/{id}/search", response_model=Session, description="Continues the session's search from its retained tree.")
+async def search_session(id:str, budget:SessionSearch):
+    prune_sessions(keep=id)
+    return await call_session(id, session.search, **session_budget(id, budget))
+
+@app.post("/sessions/{id}/move", response_model=Session, description="Plays a move, given as the HFEN of the resulting state, or the session's best move if no HFEN is given. The subtree under the move is kept and the rest is released.")
+async def move_session(id:str, move:SessionMove):
+    prune_sessions(keep=id)
+    return await call_session(id, session.move, move.hfen)
+
+@app.delete("/sessions/{id}", status_code=204, description="Ends a session and releases its tree.")
+async def delete_session(id:str):
+    if id not in sessions:
+        raise HTTPException(status_code=404, detail=f'Session {id} not found.')
+    drop_session(id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, description="Metrics in the Prometheus text format.")
+async def get_metrics():
+    process = psutil.Process()
+    workers_rss = 0
+    for child in process.children(recursive=True):
+        try:
+            workers_rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    lines = latency.render() + search_rate.render()
+    lines += metrics.metric('hexachromix_queue_depth', 'gauge', 'Searches queued or running.', {None:len(active)})
+    lines += metrics.metric('hexachromix_queue_capacity', 'gauge', 'Searches allowed to be queued or running.', {None:MAX_QUEUE})
+    lines += metrics.metric('hexachromix_resident_memory_bytes', 'gauge', 'Resident set size.', {'api':process.memory_info().rss, 'workers':workers_rss}, label='process')
+    lines += metrics.metric('hexachromix_sessions', 'gauge', 'Open analysis sessions.', {None:len(sessions)})
+    lines += metrics.metric('hexachromix_session_nodes', 'gauge', 'Tree nodes held by sessions.', {None:sum(nodes for (_,_,nodes) in sessions.values())})
+    stats = cache.stats()
+    lines += metrics.metric('hexachromix_cache_requests_total', 'counter', 'Result cache lookups.', {outcome:stats[outcome] for outcome in ['hits','extensions','misses']}, label='outcome')
+    lines += metrics.metric('hexachromix_cache_bytes', 'gauge', 'Memory used by the result cache.', {None:stats['bytes']})
+    if counter_slots is not None:
+        for (name, value) in metrics.total_counters(counter_slots).items():
+            lines += metrics.metric(f'hexachromix_core_{name}_total', 'counter', f'Core {name.replace("_", " ")} (all processes).', {None:value})
+    return '\n'.join(lines) + '\n'
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""Matches between two MCTS configurations, for tuning their biases.
+Games come in pairs with the same variant, seed and random opening, and the agents' seats swapped.
+Each team is played by one of the agents, alternating in turn order, so in variants with more than two teams an agent can play several (and each agent plays the larger share once per pair).
+An agent wins a game when one of its teams connects.
+
+Records are written to a JSONL file as games finish: a header line with the match settings, then one line per game.
+Running a match again with the same file and settings resumes it, skipping the games already recorded.
+"""
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, List, Tuple, Callable
+
+from .core import HexachromixState, VARIANTS, VARIANT_PLAYER_TEAM
+from .tree import SearchTree
+
+
+def teams(variant:str) -> List[str]:
+    """The variant's teams in the order they first move."""
+    return list(dict.fromkeys(VARIANT_PLAYER_TEAM[variant].values()))
+
+def schedule(game:int, variants:List[str]=list(VARIANTS), seed:int=0) -> Tuple[str,int,int]:
+    """The (variant, swap, seed) of the numbered game. swap is 1 when the seats are swapped."""
+    return (variants[game//2 % len(variants)], game % 2, seed + game//2)
+
+def play(game:int, variant:str, swap:int, seed:int, configs:List[dict], opening_plies:int=2, max_moves:int=200, **kwargs) -> dict:
+    """Play a game and return its record.
+    configs are the two agents' SearchTree arguments and kwargs are passed to SearchTree.search.
+    The record's moves are encoded as cell*13 + value, and its score is the first agent's: 1 (win), 0.5 (draw) or 0 (loss).
+    Games still going after max_moves are scored as draws, with a result of None.
+    """
+    rng = random.Random(seed)
+    random.seed(seed) # For the searches' rollouts.
+    owners = {team: (i + swap) % 2 for i,team in enumerate(teams(variant))}
+    state = HexachromixState(variant=variant)
+    moves = []
+    while len(moves) < opening_plies and not state.is_terminal():
+        move = rng.choice(state.get_legal_moves())
+        state = state.make_move(move)
+        moves.append(move)
+    trees = [SearchTree(state, **config) for config in configs]
+    while not state.is_terminal() and len(moves) < max_moves:
+        tree = trees[owners[state.get_current_team()]]
+        tree.search(**kwargs)
+        move = tree.best('move')
+        # Both agents keep the subtree of the move that was played.
+        for t in trees: t.advance(move)
+        state = tree.get_state()
+        moves.append(move)
+    result = state.get_result()
+    if result is None or result == 'DRAW':
+        score = 0.5
+    else:
+        score = 1 - owners[result.split()[1]]
+    return {'game':game, 'variant':variant, 'swap':swap, 'seed':seed, 'moves':[cell*13 + value for (cell,value) in moves], 'result':result, 'score':score}
+
+def replay(record:dict) -> HexachromixState:
+    """The final state of a recorded game."""
+    state = HexachromixState(variant=record['variant'])
+    for move in record['moves']:
+        state.apply(divmod(move, 13))
+    return state
+
+
+def expected_score(elo:float) -> float:
+    return 1 / (1 + 10**(-elo/400))
+
+def elo(score:float) -> float:
+    """The Elo difference with the given expected score, which is infinite for 0 and 1."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1/score - 1)
+
+
+class Score:
+    """Wins, draws and losses of the first agent."""
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def add(self, score:float):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def n(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    @property
+    def mean(self) -> float:
+        return (self.wins + self.draws/2) / self.n if self.n else 0.5
+
+    @property
+    def variance(self) -> float:
+        """Variance of a single game's score."""
+        if not self.n:
+            return 0
+        mean = self.mean
+        return (self.wins*(1-mean)**2 + self.draws*(0.5-mean)**2 + self.losses*mean**2) / self.n
+
+    def elo(self) -> float:
+        return elo(self.mean)
+
+    def interval(self, z:float=1.96) -> Tuple[float,float]:
+        """Confidence interval of the Elo difference (95% by default), from a normal approximation of the mean score."""
+        if not self.n:
+            return (-math.inf, math.inf)
+        error = z * math.sqrt(self.variance / self.n)
+        return (elo(self.mean - error), elo(self.mean + error))
+
+    def llr(self, elo0:float, elo1:float) -> float:
+        """Log-likelihood ratio of the Elo difference being elo1 rather than elo0, from a normal approximation (as in the generalized SPRT)."""
+        if not self.variance:
+            return 0
+        (s0, s1) = (expected_score(elo0), expected_score(elo1))
+        return self.n * (s1 - s0) * (2*self.mean - s0 - s1) / (2*self.variance)
+
+    def sprt(self, elo0:float, elo1:float, alpha:float=0.05, beta:float=0.05) -> Optional[str]:
+        """The result of a sequential probability ratio test of elo0 (H0) against elo1 (H1) so far: 'H0', 'H1', or None to keep playing.
+        alpha and beta are the probabilities of wrongly accepting H1 and H0.
+        """
+        llr = self.llr(elo0, elo1)
+        if llr >= math.log((1-beta)/alpha):
+            return 'H1'
+        if llr <= math.log(beta/(1-alpha)):
+            return 'H0'
+        return None
+
+    def __repr__(self):
+        (low, high) = self.interval()
+        return f'{self.wins}-{self.draws}-{self.losses} | elo={self.elo():+.1f} [{low:+.1f},{high:+.1f}]'
+
+
+def load(path:str, header:dict) -> List[dict]:
+    """The records in a match file started with the given header, creating it if needed.
+    A partly written last line (from an interrupted match) is removed.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, 'w') as f:
+            f.write(json.dumps(header) + '\n')
+        return []
+    records = []
+    with open(path, 'rb+') as f:
+        lines = f.readlines()
+        end = 0
+        for i,line in enumerate(lines):
+            if not line.endswith(b'\n'):
+                break
+            try:
+                value = json.loads(line)
+            except ValueError:
+                break
+            if i == 0:
+                if value != header:
+                    raise ValueError(f'{path} is a match with different settings: {value}.')
+            else:
+                records.append(value)
+            end += len(line)
+        if end == 0:
+            raise ValueError(f'Invalid match file {path}.')
+        f.truncate(end)
+    return records
+
+def run(path:str, configs:List[dict], games:int, variants:List[str]=list(VARIANTS), workers:int=1, seed:int=0, opening_plies:int=2, max_moves:int=200,
+        sprt:Optional[Tuple[float,float]]=None, alpha:float=0.05, beta:float=0.05, callback:Optional[Callable]=None, **kwargs) -> Tuple[Score,Optional[str]]:
+    """Play up to games games in parallel processes, appending their records to path (resuming from the records already there).
+    If sprt is an (elo0, elo1) pair, stop once the test concludes. kwargs are passed to SearchTree.search.
+    callback (if given) is called with each new record and the score so far.
+    Returns the score and the SPRT result.
+    """
+    if kwargs.get('max_iterations') is None and kwargs.get('max_time') is None:
+        raise ValueError('At least one of [max_iterations,max_time] is required.')
+    header = {'configs':configs, 'variants':variants, 'seed':seed, 'opening_plies':opening_plies, 'max_moves':max_moves, **kwargs}
+    records = load(path, header)
+    score = Score()
+    for record in records:
+        score.add(record['score'])
+    done = {record['game'] for record in records}
+    pending = (game for game in range(games) if game not in done)
+    result = score.sprt(*sprt, alpha, beta) if sprt else None
+    if result is not None:
+        return (score, result)
+
+    futures = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(path, 'a') as f:
+        while True:
+            # Keep a few games queued per worker, so stopping early wastes little.
+            for game in pending:
+                futures.add(executor.submit(play, game, *schedule(game, variants, seed), configs, opening_plies, max_moves, **kwargs))
+                if len(futures) >= 2*workers:
+                    break
+            if not futures:
+                break
+            (finished, futures) = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                f.write(json.dumps(record, separators=(',',':')) + '\n')
+                f.flush()
+                score.add(record['score'])
+                if callback is not None:
+                    callback(record, score)
+            if sprt and (result := score.sprt(*sprt, alpha, beta)) is not None:
+                # Games already running are finished but not recorded.
+                executor.shutdown(cancel_futures=True)
+                break
+    return (score, result)
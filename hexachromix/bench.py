@@ -0,0 +1,176 @@
+"""Benchmarks of the engine, with results that can be saved as JSON and compared with a baseline.
+Perft counts are under 'perft', by variant. Other metric names end in _ns or _ms (lower is better) or _per_sec (higher is better).
+Timings are medians of repeated runs, since single runs vary by tens of percent.
+"""
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from timeit import Timer
+from typing import Optional, List
+
+from multimcts import MCTS
+
+from .core import HexachromixState, VARIANTS
+from .tree import SearchTree
+
+SECTIONS = ['perft', 'micro', 'playouts', 'mcts', 'api']
+
+# Leaf counts from the start of each variant, by depth (starting at 1).
+# Move generation and terminal detection don't depend on the variant, so they're the same for all of them.
+PERFT = {variant: [19, 342, 6156, 104994, 1784898, 28843254] for variant in VARIANTS}
+
+
+def perft(state:HexachromixState, depth:int) -> int:
+    """Number of move sequences of the given length, stopping at finished games."""
+    if depth == 0:
+        return 1
+    if state.is_terminal():
+        return 0
+    moves = state.get_legal_moves()
+    if depth == 1:
+        return len(moves)
+    n = 0
+    for move in moves:
+        state.apply(move)
+        n += perft(state, depth-1)
+        state.undo()
+    return n
+
+def positions(n:int, seed:int=0) -> List[HexachromixState]:
+    """Positions from random games, with fixed seed, for the microbenchmarks."""
+    rng = random.Random(seed)
+    states = []
+    while len(states) < n:
+        state = HexachromixState(variant=rng.choice(VARIANTS))
+        while not state.is_terminal() and len(states) < n:
+            states.append(state)
+            state = state.make_move(rng.choice(state.get_legal_moves()))
+    return states
+
+def per_call_ns(fn, states:List[HexachromixState], repeat:int=15, number:int=10) -> float:
+    """Median of repeat runs of fn over every state (number times each), in nanoseconds per call (including the call overhead)."""
+    def run():
+        for state in states:
+            fn(state)
+    timer = Timer(run)
+    return statistics.median(timer.repeat(repeat=repeat, number=number)) / number / len(states) * 1e9
+
+def median_seconds(fn, repeat:int=7) -> float:
+    """Median time of repeat calls of fn."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+def bench_perft(depth:int) -> dict:
+    results = {'perft':{}}
+    for variant in VARIANTS:
+        t0 = time.perf_counter()
+        results['perft'][variant] = [perft(HexachromixState(variant=variant), d) for d in range(1, depth+1)]
+        results[f'perft_{variant}_ms'] = (time.perf_counter() - t0) * 1000
+    return results
+
+def bench_micro() -> dict:
+    states = positions(1000)
+    moves = [random.Random(i).choice(state.get_legal_moves()) for i,state in enumerate(states)]
+    pairs = list(zip(states, moves))
+    return {
+        'bfs_ns': per_call_ns(lambda state: state._has_path_bfs(0), states),
+        'has_path_ns': per_call_ns(lambda state: state.has_path(), states),
+        'get_legal_moves_ns': per_call_ns(lambda state: state.get_legal_moves(), states),
+        'make_move_ns': per_call_ns(lambda pair: pair[0].make_move(pair[1]), pairs),
+        'hfen_round_trip_ns': per_call_ns(lambda state: HexachromixState(hfen=state.hfen), states),
+    }
+
+def bench_playouts(n:int=20_000) -> dict:
+    return {'playouts_per_sec': n / median_seconds(lambda: HexachromixState().rollout(n, seed=1))}
+
+def bench_mcts(iterations:int=5_000) -> dict:
+    """Iterations per second of multimcts.MCTS (as /best/ and /analysis/ search) and of SearchTree (as sessions and the CLI search)."""
+    def mcts():
+        random.seed(1)
+        MCTS(1, 1).search(HexachromixState(), max_iterations=iterations)
+    def tree():
+        random.seed(1)
+        SearchTree(HexachromixState(), 1, 1).search(max_iterations=iterations)
+    return {
+        'mcts_iterations_per_sec': iterations / median_seconds(mcts),
+        'tree_iterations_per_sec': iterations / median_seconds(tree),
+    }
+
+def bench_api(requests:int=50, max_iterations:int=1000) -> dict:
+    """/best/ latency percentiles against a local uvicorn, with the result cache, opening book and solver off so every request searches."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, HEXACHROMIX_CACHE_MB='0', HEXACHROMIX_SOLVER_EMPTY='-1')
+    for name in ['HEXACHROMIX_CACHE_PATH', 'HEXACHROMIX_BOOK']:
+        env.pop(name, None)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'hexachromix.api:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        env=env,
+    )
+    url = f'http://127.0.0.1:{port}/best/?max_iterations={max_iterations}&hfen='
+    try:
+        hfens = [state.hfen.replace(' ', '%20') for state in positions(requests, seed=1)]
+        # Wait for startup, which also warms up the process pool.
+        for _ in range(300):
+            try:
+                urllib.request.urlopen(url + hfens[0]).read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        latencies = []
+        for hfen in hfens:
+            t0 = time.perf_counter()
+            urllib.request.urlopen(url + hfen).read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies)-1, int(p/100*len(latencies)))]
+    return {f'best_p{p}_ms': percentile(p) for p in (50, 90, 99)}
+
+def run(sections:List[str]=SECTIONS, perft_depth:int=5) -> dict:
+    results = {}
+    for section in sections:
+        if section == 'perft':
+            results.update(bench_perft(perft_depth))
+        elif section == 'micro':
+            results.update(bench_micro())
+        elif section == 'playouts':
+            results.update(bench_playouts())
+        elif section == 'mcts':
+            results.update(bench_mcts())
+        elif section == 'api':
+            results.update(bench_api())
+        else:
+            raise ValueError(f'Invalid section "{section}". Must be one of {SECTIONS}.')
+    return results
+
+def check(results:dict, baseline:Optional[dict]=None, threshold:float=0.3) -> List[str]:
+    """Failures: perft counts that differ from PERFT or the baseline, and metrics more than threshold (a fraction) worse than the baseline."""
+    failures = []
+    for variant,counts in results.get('perft', {}).items():
+        for expected in [PERFT[variant], (baseline or {}).get('perft', {}).get(variant, [])]:
+            n = min(len(counts), len(expected))
+            if counts[:n] != expected[:n]:
+                failures.append(f'perft {variant}: {counts[:n]} != {expected[:n]}')
+    for name,value in results.items():
+        if baseline is None or name not in baseline or name == 'perft':
+            continue
+        if name.endswith('_per_sec'):
+            change = 1 - value / baseline[name]
+        else:
+            change = value / baseline[name] - 1
+        if change > threshold:
+            failures.append(f'{name}: {value:.4g} vs {baseline[name]:.4g} baseline ({change:.1%} worse)')
+    return failures
@@ -0,0 +1,81 @@
+"""Opening books: best moves near the start of each variant, found ahead of time by deep searches.
+A book file is a header followed by fixed-size records sorted by the Zobrist key of the canonical position.
+It is memory-mapped and binary-searched, so opening it reads nothing and a lookup touches a few pages.
+"""
+import mmap
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, List, Tuple, Callable
+
+from .core import HexachromixState, VARIANT_PLAYER_TEAM
+from . import search
+
+MAGIC = b'HXBK\x01\x00\x00\x00' # Format name and version.
+RECORD = struct.Struct('<QBBxxIf') # Key, move (cell, color), visits and average reward of the move: 20 bytes.
+
+
+class Book:
+    """A memory-mapped opening book, as written by build."""
+    def __init__(self, path:str):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC or (len(self.mm) - len(MAGIC)) % RECORD.size:
+            self.mm.close()
+            raise ValueError(f'Invalid book file {path}.')
+        self.n = (len(self.mm) - len(MAGIC)) // RECORD.size
+
+    def __len__(self):
+        return self.n
+
+    def probe(self, state:HexachromixState) -> Optional[Tuple[tuple,int,float]]:
+        """The book's (move, visits, reward) for the state, or None if it isn't in the book."""
+        (canonical, symmetry) = state.canonical()
+        key = canonical.key
+        (lo, hi) = (0, self.n)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (mid_key, cell, color, visits, reward) = RECORD.unpack_from(self.mm, len(MAGIC) + mid*RECORD.size)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return (symmetry.unmap_move((cell, color)), visits, reward)
+        return None
+
+    def close(self):
+        self.mm.close()
+
+
+def positions(variant:str, plies:int) -> List[HexachromixState]:
+    """The canonical non-terminal positions with fewer than plies moves played."""
+    level = {HexachromixState(variant=variant).canonical()[0]}
+    found = []
+    for _ in range(plies):
+        level = {state for state in level if not state.is_terminal()}
+        found.extend(level)
+        level = {state.make_move(move).canonical()[0] for state in level for move in state.get_legal_moves()} - set(found)
+    return found
+
+def build(path:str, variants:List[str]=list(VARIANT_PLAYER_TEAM), plies:int=2, workers:int=1, callback:Optional[Callable]=None, **kwargs) -> int:
+    """Search the positions of each variant in parallel processes and write the best moves to a book at path.
+    kwargs are passed to search.analysis, and callback (if given) is called with each state and its (move, visits, reward) as they finish.
+    Returns the number of records.
+    """
+    states = [state for variant in variants for state in positions(variant, plies)]
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(search.analysis, state.hfen, **kwargs):state for state in states}
+        for future in as_completed(futures):
+            state = futures[future]
+            best = max(future.result(), key=lambda n:n['reward']) # As search.best_of.
+            move = next(move for move in state.get_legal_moves() if state.make_move(move).hfen == best['hfen'])
+            records.append((state.key, move, best['visits'], best['reward']))
+            if callback is not None:
+                callback(state, records[-1][1:])
+    records.sort()
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for (key, (cell, color), visits, reward) in records:
+            f.write(RECORD.pack(key, cell, color, visits, reward))
+    return len(records)
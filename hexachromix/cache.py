@@ -0,0 +1,90 @@
+"""A cache of analyses, so repeated requests about the same position don't search again."""
+import json
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, List, Tuple
+
+ENTRY_OVERHEAD = 200 # Rough bytes per entry beyond its key and children, for the size limit.
+
+
+class ResultCache:
+    """Analyses (as from search.analysis) along with the effort that produced them: total iterations and total search seconds.
+    Entries are evicted least recently used first once their total size passes max_bytes.
+    If path is given, entries are also written to an SQLite database there and read back on a miss, so a warm cache survives restarts.
+    """
+    def __init__(self, max_bytes:int, path:Optional[str]=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (children as JSON, iterations, seconds)
+        self.bytes = 0
+        self.hits = 0 # Answered from the cache.
+        self.extensions = 0 # Cached, but with less effort than requested, so the search was continued.
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, children TEXT, iterations INTEGER, seconds REAL)')
+            self.db.commit()
+
+    @staticmethod
+    def key(position:bytes, exploration_bias:float, rave_bias:float) -> str:
+        """position is the state's to_bytes."""
+        return f'{position.hex()} {float(exploration_bias)!r} {float(rave_bias)!r}'
+
+    def get(self, key:str, iterations:int, seconds:float) -> Optional[Tuple[List[dict], int, float]]:
+        """The cached (children, iterations, seconds) for key, or None.
+        A request for the given iterations or seconds (whichever is reached first) counts as a hit if the entry reached either, and as an extension otherwise.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.db is not None:
+            row = self.db.execute('SELECT children, iterations, seconds FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                entry = row
+                self.remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        (children, cached_iterations, cached_seconds) = entry
+        if cached_iterations >= iterations or cached_seconds >= seconds:
+            self.hits += 1
+        else:
+            self.extensions += 1
+        return (json.loads(children), cached_iterations, cached_seconds)
+
+    def put(self, key:str, children:List[dict], iterations:int, seconds:float):
+        entry = (json.dumps(children, separators=(',',':')), iterations, seconds)
+        self.remember(key, entry)
+        if self.db is not None:
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (key, *entry))
+            self.db.commit()
+
+    def remember(self, key:str, entry:tuple):
+        """Keep the entry in memory, evicting the least recently used entries to make room."""
+        self.forget(key)
+        size = len(key) + len(entry[0]) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self.forget(next(iter(self.entries)))
+
+    def forget(self, key:str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(key) + len(entry[0]) + ENTRY_OVERHEAD
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'extensions': self.extensions,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
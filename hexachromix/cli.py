@@ -1,10 +1,21 @@
 import argparse
+import json
+import os
+import sys
 import time
 import resource
-import re
 
+from concurrent.futures import ProcessPoolExecutor
 from multimcts import MCTS
-from .core import HexachromixState
+from .core import HexachromixState, INT2CHAR
+from . import core
+from .tree import SearchTree
+from . import search
+from .book import Book
+from . import book as opening_book
+from .solver import Solver, decisive
+from . import bench
+from . import arena
 
 
 def main():
@@ -17,6 +28,7 @@ def main():
         'pruning-bias': {'type':float, 'help':'MCTS pruning bias. Default 0.', 'default':0},
         'max-iterations': {'type':int, 'help':'Number of MCTS simulations to perform per move.'},
         'max-time': {'type':float, 'help':'Time (seconds) that MCTS will search per move.'},
+        'workers': {'type':int, 'help':'Number of processes searching in parallel (root parallelization). Default 1.', 'default':1},
         'colors': {'type':str, 'help':'Player colors, a string containing any of RYGCBM.'},
         'eb1': {'type':float, 'help':'Exploration bias of the first MCTS agent.'},
         'rb1': {'type':float, 'help':'RAVE bias of the first MCTS agent.'},
@@ -26,6 +38,26 @@ def main():
         'pb2': {'type':float, 'help':'Pruning bias of the second MCTS agent.'},
         'render-mode': {'choices':['char','dot'], 'help':'What should appear in board spaces?', 'default':'char'},
         'highlight-moves': {'action':'store_true', 'help':'Highlight legal moves?'},
+        'book': {'type':str, 'help':'Opening book to play from before searching. Default $HEXACHROMIX_BOOK.', 'default':os.environ.get('HEXACHROMIX_BOOK')},
+        'solver-empty': {'type':int, 'help':'Try the exact solver first when at most this many cells are empty (-1 to never). Default 1.', 'default':1},
+        'solver-time': {'type':float, 'help':'Time (seconds) the exact solver may take per move. Default 1.', 'default':1},
+        'max-plies': {'type':int, 'help':'How many plies ahead the exact solver may look. Default 32.', 'default':32},
+        'sections': {'nargs':'+', 'choices':bench.SECTIONS, 'help':'Benchmarks to run. Default all.', 'default':bench.SECTIONS},
+        'perft-depth': {'type':int, 'help':'Perft depth. Default 5.', 'default':5},
+        'json': {'type':str, 'help':'File to write the results to as JSON.'},
+        'baseline': {'type':str, 'help':'JSON results to compare with. Fails if any metric is worse by more than the threshold.'},
+        'threshold': {'type':float, 'help':'Allowed slowdown relative to the baseline, as a fraction. Default 0.3.', 'default':0.3},
+        'output': {'type':str, 'help':'File to write. Default "book.bin".', 'default':'book.bin'},
+        'plies': {'type':int, 'help':'Positions with fewer than this many moves played are searched. Default 2.', 'default':2},
+        'variants': {'nargs':'+', 'choices':['MRY','MR','R'], 'help':'Hexachromix variants. Default all.', 'default':['MRY','MR','R']},
+        'games': {'type':int, 'help':'Number of games to play. Default 100.', 'default':100},
+        'records': {'type':str, 'help':'JSONL file to write game records to, and to resume from if it exists. Default "arena.jsonl".', 'default':'arena.jsonl'},
+        'seed': {'type':int, 'help':'Seed of the first pair of games. Default 0.', 'default':0},
+        'opening-plies': {'type':int, 'help':'Random moves at the start of each pair of games. Default 2.', 'default':2},
+        'max-moves': {'type':int, 'help':'Games still going after this many moves are draws. Default 200.', 'default':200},
+        'sprt': {'type':float, 'nargs':2, 'metavar':('ELO0','ELO1'), 'help':'Stop once a sequential probability ratio test of the first agent being ELO0 or ELO1 Elo stronger concludes.'},
+        'alpha': {'type':float, 'help':'SPRT probability of wrongly accepting ELO1. Default 0.05.', 'default':0.05},
+        'beta': {'type':float, 'help':'SPRT probability of wrongly accepting ELO0. Default 0.05.', 'default':0.05},
     }
     def add_args(parser:argparse.ArgumentParser, argnames:list):
         for argname in argnames:
@@ -36,32 +68,51 @@ def main():
 
     add_args(
         subparsers.add_parser('sim', help='Simulate a game using MCTS.'),
-        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','render-mode','highlight-moves']
+        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','workers','book','solver-empty','solver-time','render-mode','highlight-moves']
     )
     add_args(
         subparsers.add_parser('sim2', help='Simulate a game between two MCTS agents.'),
-        ['profile','hfen','eb1','rb1','pb1','eb2','rb2','pb2','max-iterations','max-time','render-mode','highlight-moves']
+        ['profile','hfen','eb1','rb1','pb1','eb2','rb2','pb2','max-iterations','max-time','book','solver-empty','solver-time','render-mode','highlight-moves']
+    )
+    add_args(
+        subparsers.add_parser('arena', help='Play many games between two MCTS agents in parallel and compare their strength.'),
+        ['profile','variants','exploration-bias','rave-bias','pruning-bias','eb1','rb1','pb1','eb2','rb2','pb2','max-iterations','max-time','workers','games','records','seed','opening-plies','max-moves','sprt','alpha','beta']
     )
     add_args(
         subparsers.add_parser('play', help='Play a game against MCTS AI.'),
-        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','colors','render-mode','highlight-moves']
+        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','colors','book','solver-empty','solver-time','render-mode','highlight-moves']
     )
     add_args(
         subparsers.add_parser('best', help='Find the best move from a given position.'),
-        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','render-mode','highlight-moves']
+        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','workers','book','solver-empty','solver-time','render-mode','highlight-moves']
     )
     add_args(
         subparsers.add_parser('tree', help='Visualize the MCTS tree.'),
-        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','render-mode','highlight-moves']
+        ['profile','variant','hfen','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','workers','render-mode','highlight-moves']
     )
     add_args(
         subparsers.add_parser('moves', help='Get legal moves from a given position.'),
         ['profile','hfen','variant','render-mode','highlight-moves']
     )
+    add_args(
+        subparsers.add_parser('solve', help='Prove the result of an endgame with exact search.'),
+        ['profile','variant','hfen','max-plies','max-time','render-mode','highlight-moves']
+    )
+    add_args(
+        subparsers.add_parser('bench', help='Benchmark the engine.'),
+        ['profile','sections','perft-depth','json','baseline','threshold']
+    )
+    book_subparsers = subparsers.add_parser('book', help='Opening book commands.').add_subparsers(dest='book_command')
+    add_args(
+        book_subparsers.add_parser('build', help='Search the first plies of each variant and write an opening book.'),
+        ['profile','variants','plies','exploration-bias','rave-bias','pruning-bias','max-iterations','max-time','workers','output']
+    )
 
     args = parser.parse_args()
+    if getattr(args,'max_plies',1) < 1:
+        parser.error('--max-plies must be positive.')
 
-    if args.hfen:
+    if getattr(args,'hfen',None):
         hfen = args.hfen
     else:
         try: hfen = '3/4/5/4/3 R ' + args.variant
@@ -71,26 +122,58 @@ def main():
     pb = getattr(args,'pruning_bias',0)
     max_iterations = getattr(args,'max_iterations',None)
     max_time = getattr(args,'max_time',None)
-    render_mode = getattr(args,'render_mode')
-    hl_moves = getattr(args,'highlight_moves')
+    render_mode = getattr(args,'render_mode',None)
+    hl_moves = getattr(args,'highlight_moves',False)
+    workers = getattr(args,'workers',1)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and args.command not in ('book','arena') else None
+    book = Book(args.book) if getattr(args,'book',None) else None
+    def book_move(state):
+        """The opening book's move, or None if the state isn't in the book."""
+        record = book.probe(state) if book else None
+        return record and record[0]
+    endgame = None
+    def solved_move(state):
+        """The exact solver's move, or None if the state has too many empty cells or no decisive result was proven in time."""
+        nonlocal endgame
+        if state.count_empty() > getattr(args,'solver_empty',-1):
+            return None
+        if endgame is None:
+            endgame = Solver()
+        # Keep it under half of a time budget.
+        solution = endgame.solve(state, max_time=args.solver_time if max_time is None else min(args.solver_time, max_time/2))
+        return solution['move'] if decisive(solution, state) else None
+    def parallel_analysis(state):
+        return search.parallel_analysis(state.hfen, workers, executor, exploration_bias=eb, rave_bias=rb, pruning_bias=pb, max_iterations=max_iterations, max_time=max_time)
 
     if args.profile:
         import cProfile
         import pstats
         profiler = cProfile.Profile()
         profiler.enable()
+        # cProfile can't see inside core, so count its hot paths too (this process only).
+        core.enable_counters()
 
     if args.command == "sim":
         import psutil
         t0 = time.time()
         m0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024**2)
         def maxmem(): return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024**2)
-        mcts = MCTS(eb,rb,pb)
         state = HexachromixState(hfen=hfen)
+        tree = SearchTree(state, eb, rb, pb)
         print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
         n = 0
         while not state.is_terminal():
-            state = mcts.search(state, max_iterations=max_iterations, max_time=max_time)
+            if move := book_move(state) or solved_move(state):
+                tree.advance(move)
+                state = tree.get_state()
+            elif executor:
+                state = HexachromixState(hfen=search.best_of(parallel_analysis(state)))
+                tree.advance_to(state)
+            else:
+                # Keep the chosen move's subtree for the next turn.
+                tree.search(max_iterations=max_iterations, max_time=max_time)
+                tree.advance(tree.best('move'))
+                state = tree.get_state()
             print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
             n += 1
         print(f'\nresult={state.get_result()}')
@@ -101,23 +184,52 @@ def main():
         if n and max_iterations and not max_time: print(f'avg {t*1000/n/max_iterations:.3f} ms per turn per iteration ({round(t*1000)}/{n}/{max_iterations})')
     elif args.command == "sim2":
         import psutil
-        mcts1 = MCTS(args.eb1, args.rb1, args.pb1)
-        mcts2 = MCTS(args.eb2, args.rb2, args.pb2)
-        # mcts3 = MCTS(args.eb3, args.rb3)
         state = HexachromixState(hfen=hfen)
+        trees = {
+            'MRY': SearchTree(state, args.eb1, args.rb1, args.pb1),
+            'GCB': SearchTree(state, args.eb2, args.rb2, args.pb2),
+        }
         print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
         while not state.is_terminal():
-            mcts = {'MRY':mcts1,'GCB':mcts2}[state.get_current_team()]
-            state = mcts.search(state, max_iterations=max_iterations, max_time=max_time)
+            tree = trees[state.get_current_team()]
+            if not (move := book_move(state) or solved_move(state)):
+                tree.search(max_iterations=max_iterations, max_time=max_time)
+                move = tree.best('move')
+            # Both agents keep the subtree of the move that was played.
+            for t in trees.values(): t.advance(move)
+            state = tree.get_state()
             print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
         print(f'\nresult={state.get_result()}')
+    elif args.command == "arena":
+        # Either agent's biases default to the shared ones.
+        configs = [
+            {'exploration_bias':eb if e is None else e, 'rave_bias':rb if r is None else r, 'pruning_bias':pb if p is None else p}
+            for (e,r,p) in [(args.eb1,args.rb1,args.pb1), (args.eb2,args.rb2,args.pb2)]
+        ]
+        t0 = time.time()
+        def progress(record, score):
+            line = f'game {record["game"]} {record["variant"]} | result={record["result"]} | score={record["score"]} | {score}'
+            if args.sprt:
+                line += f' | llr={score.llr(*args.sprt):.2f}'
+            print(line)
+        (score, result) = arena.run(
+            args.records, configs, args.games, args.variants, workers, args.seed, args.opening_plies, args.max_moves, args.sprt, args.alpha, args.beta, progress,
+            max_iterations=max_iterations, max_time=max_time,
+        )
+        print(f'\n{score.n} games ({score}) in {time.time()-t0:.3f} seconds')
+        if result:
+            print(f'SPRT accepted {result}: {args.sprt[result == "H1"]:+g} Elo')
     elif args.command == "play":
-        mcts = MCTS(eb,rb,pb)
         state = HexachromixState(hfen=hfen)
+        tree = SearchTree(state, eb, rb, pb)
         print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
         while not state.is_terminal():
             if state.color not in args.colors:
-                state = mcts.search(state, max_iterations=max_iterations, max_time=max_time)
+                if not (move := book_move(state) or solved_move(state)):
+                    tree.search(max_iterations=max_iterations, max_time=max_time)
+                    move = tree.best('move')
+                tree.advance(move)
+                state = tree.get_state()
             else:
                 moves = state.get_legal_moves()
                 while True:
@@ -131,7 +243,8 @@ def main():
                                 break
                         if move is None:
                             raise ValueError
-                        state = state.make_move(move)
+                        tree.advance(move)
+                        state = tree.get_state()
                         break
                     except KeyboardInterrupt: exit()
                     except: pass
@@ -140,8 +253,22 @@ def main():
     elif args.command == "best":
         state = HexachromixState(hfen=hfen)
         print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
-        state = MCTS(eb,rb,pb).search(state, max_iterations=max_iterations, max_time=max_time)
+        if move := book_move(state) or solved_move(state):
+            state = state.make_move(move)
+        elif executor:
+            state = HexachromixState(hfen=search.best_of(parallel_analysis(state)))
+        else:
+            state = MCTS(eb,rb,pb).search(state, max_iterations=max_iterations, max_time=max_time)
+        print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
+    elif args.command == "tree" and executor:
+        # Only the root children's merged stats are available from parallel searches.
+        state = HexachromixState(hfen=hfen)
         print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
+        children = parallel_analysis(state)
+        print(f'visits={sum(child["visits"] for child in children)} ({workers} workers)')
+        for i,child in enumerate(children):
+            if i < 3: print(render_hfen(child['hfen'], show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
+            print(f'  {child["hfen"]} | visits={child["visits"]} | avg={child["reward"]:.3f}')
     elif args.command == "tree":
         node = MCTS(eb,rb,pb).search(HexachromixState(hfen=hfen), max_iterations=max_iterations, max_time=max_time, return_type='node').get_parent()
         state = node.get_state()
@@ -157,13 +284,52 @@ def main():
         state = HexachromixState(hfen=hfen)
         for move in state.get_legal_moves():
             print(state.make_move(move).hfen)
+    elif args.command == "solve":
+        state = HexachromixState(hfen=hfen)
+        print(render_hfen(state.hfen, show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
+        t0 = time.time()
+        solution = Solver().solve(state, max_plies=args.max_plies, max_time=max_time)
+        if solution['result'] is None:
+            print(f'not proven within {solution["plies"]} plies')
+        else:
+            print(render_hfen(solution['hfen'], show_hfen=True, mode=render_mode, highlight_moves=hl_moves))
+            print(f'{solution["result"]} for {state.get_current_team()} within {solution["plies"]} plies | move={solution["move"]}')
+        print(f'{solution["nodes"]} nodes in {time.time()-t0:.3f} seconds')
+    elif args.command == "bench":
+        results = bench.run(args.sections, args.perft_depth)
+        for name,value in results.items():
+            print(f'{name}: {value if name == "perft" else f"{value:.3f}"}')
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        failures = bench.check(results, baseline, args.threshold)
+        for failure in failures:
+            print(f'FAIL {failure}')
+        if failures:
+            sys.exit(1)
+    elif args.command == "book" and args.book_command == "build":
+        t0 = time.time()
+        def progress(state, record):
+            (move, visits, reward) = record
+            print(f'{state.hfen} | move={move} | visits={visits} | avg={reward:.3f}')
+        n = opening_book.build(args.output, args.variants, args.plies, workers, progress, exploration_bias=eb, rave_bias=rb, pruning_bias=pb, max_iterations=max_iterations, max_time=max_time)
+        print(f'\n{n} positions written to {args.output} in {time.time()-t0:.3f} seconds')
     else:
         print("Unknown command. Use --help for guidance.")
 
+    if executor:
+        executor.shutdown()
+
     if args.profile:
         profiler.disable()
         stats = pstats.Stats(profiler).sort_stats('tottime')
         stats.print_stats(20)
+        for name,value in core.get_counters().items():
+            print(f'{name}: {value}')
 
 
 def colorize(txt:str, color=None):
@@ -189,8 +355,9 @@ def render_hfen(hfen:str, *, show_hfen=False, mode:str='char', highlight_moves:b
         'r':'MY', 'y':'RG', 'g':'YC', 'c':'GB', 'b':'CM', 'm':'BR',
     }
 
-    (board, cur_color, _) = hfen.split()
-    board = re.sub(r'\d', lambda x: '-'*int(x.group(0)), board).replace('/','')
+    state = HexachromixState(hfen=hfen)
+    board = ''.join(INT2CHAR[value] for value in memoryview(state))
+    cur_color = state.color
 
     def can_play(color, c):
         return (color=='R' and c in '-rBG') or (color=='Y' and c in '-yMC') or (color=='G' and c in '-gRB') or (color=='C' and c in '-cYM') or (color=='B' and c in '-bGR') or (color=='M' and c in '-mCY')
@@ -1,11 +1,13 @@
 # cython: language_level=3
 # cython: profile=False
 
-import re
 from typing import Tuple, Hashable
-from random import choice
+from random import choice, getrandbits
 
 cimport cython
+from libc.stdlib cimport malloc, calloc, realloc, free
+from libc.string cimport memcmp
+from cpython.buffer cimport PyBUF_WRITABLE, PyBUF_FORMAT
 
 
 # Set up some constants.
@@ -23,9 +25,85 @@ VARIANT_PLAYER_TEAM = {
     }.items()
 }
 
+# Variants are stored by their index in VARIANTS.
+VARIANTS = ('MRY','MR','R')
+# PLAYER_TEAMS[variant][player] is the player's team.
+cdef tuple PLAYER_TEAMS = tuple(tuple(VARIANT_PLAYER_TEAM[v][c] for c in COLORS) for v in VARIANTS)
+
 INT2CHAR = ['-','R','Y','G','C','B','M','r','y','g','c','b','m']
 CHAR2INT = {c:i for i,c in enumerate(INT2CHAR)}
 
+
+# HFEN codec.
+
+class HFENError(ValueError):
+    """An HFEN that doesn't describe a state."""
+
+cdef const char *CELL_CHARS = b'-RYGCBMrygcbm'
+cdef const char *PLAYER_CHARS = b'RYGCBM'
+cdef unsigned char[5] ROW_LENGTHS = [3,4,5,4,3]
+cdef unsigned char[256] CHAR_VALUES # Cell value of each character, or 255 if it isn't a cell.
+cdef unsigned int _c
+for _c in range(256): CHAR_VALUES[_c] = 255
+for _c in range(13): CHAR_VALUES[<unsigned char>CELL_CHARS[_c]] = _c
+cdef Py_ssize_t[1] BOARD_SHAPE = [19] # For buffer views of the board.
+cdef char *BOARD_FORMAT = b'B'
+
+cdef int parse_hfen(str hfen, unsigned char *board, unsigned char *player, unsigned char *variant_idx) except -1:
+    """Parse an HFEN into the board, player and variant index, or raise HFENError."""
+    def error(reason):
+        return HFENError(f'Invalid HFEN "{hfen}": {reason}.')
+    # Fields are separated by any whitespace, as with str.split.
+    fields = hfen.split()
+    if len(fields) != 3:
+        raise error('expected "<board> <color> <variant>"')
+    (board_field, color, variant) = fields
+    cdef bytes data
+    try:
+        data = board_field.encode('ascii')
+    except UnicodeEncodeError:
+        raise error('not ASCII')
+    cdef const unsigned char *s = data
+    cdef Py_ssize_t n = len(data), pos = 0
+    cdef unsigned char c, value, run, row = 0, cells = 0, i = 0
+
+    # The board: rows of 3, 4, 5, 4 and 3 cells separated by slashes, with digits for runs of empty cells.
+    while pos < n:
+        c = s[pos]
+        pos += 1
+        if c == ord('/'):
+            if cells != ROW_LENGTHS[row]:
+                raise error(f'row {row+1} has {cells} cells instead of {ROW_LENGTHS[row]}')
+            row += 1
+            cells = 0
+            if row == 5:
+                raise error('more than 5 rows')
+            continue
+        if ord('1') <= c <= ord('9'):
+            (value, run) = (0, c - ord('0'))
+        elif CHAR_VALUES[c] != 255:
+            (value, run) = (CHAR_VALUES[c], 1)
+        else:
+            raise error(f'unexpected character "{chr(c)}"')
+        if cells + run > ROW_LENGTHS[row]:
+            raise error(f'row {row+1} has more than {ROW_LENGTHS[row]} cells')
+        cells += run
+        while run:
+            board[i] = value
+            i += 1
+            run -= 1
+    if row != 4 or cells != ROW_LENGTHS[4]:
+        raise error('the board needs 5 rows')
+
+    # Then the color to move and the variant.
+    if len(color) != 1 or color not in 'RYGCBM':
+        raise error(f'invalid color "{color}"')
+    player[0] = 'RYGCBM'.index(color)
+    if variant not in VARIANTS:
+        raise error(f'invalid variant "{variant}", must be one of {VARIANTS}')
+    variant_idx[0] = VARIANTS.index(variant)
+    return 0
+
 cdef unsigned char[6][4][2] TRANSFORMATIONS = [
     [
         [CHAR2INT[c] for c in pair]
@@ -42,56 +120,216 @@ cdef unsigned char[6][4][2] TRANSFORMATIONS = [
 ]
 
 
+# Hot-path counters. They are off unless enabled, and then each costs one predictable branch.
+COUNTERS = ('path_checks','legal_move_generations','make_move_allocations','playouts','nodes_expanded')
+cdef enum:
+    PATH_CHECKS, LEGAL_MOVE_GENERATIONS, MAKE_MOVE_ALLOCATIONS, PLAYOUTS, NODES_EXPANDED, N_COUNTERS
+cdef bint counting = False
+cdef unsigned long long[N_COUNTERS] local_counts
+cdef unsigned long long *counts = local_counts
+cdef object counts_buffer = None # Keeps a buffer given to use_counters alive.
+
+cdef inline void count(unsigned char counter, unsigned long long n=1) noexcept nogil:
+    if counting:
+        counts[counter] += n
+
+def enable_counters(on:bool=True):
+    global counting
+    counting = on
+
+def use_counters(buffer=None):
+    """Keep the counters in a writable buffer of len(COUNTERS) unsigned 64-bit integers, such as shared memory that another process reads.
+    None goes back to this module's own counters.
+    """
+    global counts, counts_buffer
+    cdef unsigned long long[::1] view
+    if buffer is None:
+        (counts, counts_buffer) = (local_counts, None)
+        return
+    view = buffer
+    if view.shape[0] != N_COUNTERS: raise ValueError(f'Invalid buffer. Must hold {N_COUNTERS} counters.')
+    (counts, counts_buffer) = (&view[0], view)
+
+def add_count(name:str, n:int=1):
+    """Add to a counter from outside this module (nothing happens unless counters are enabled)."""
+    count(COUNTERS.index(name), n)
+
+def get_counters() -> dict:
+    return {name:counts[i] for i,name in enumerate(COUNTERS)}
+
+def reset_counters():
+    cdef unsigned char i
+    for i in range(N_COUNTERS):
+        counts[i] = 0
+
+
 cdef class HexachromixState:
     cdef unsigned char[19] board
     cdef unsigned char player
-    cdef variant
+    cdef unsigned char variant_idx
+    cdef unsigned int[6] occupied # Bitboard of the cells each color occupies (bit i is cell i).
+    cdef unsigned long long zobrist
+    cdef unsigned char *history # Undo stack of (cell, previous value) pairs, allocated on the first apply.
+    cdef unsigned int n_history, history_size
 
-    def __init__(self, board:list=[0]*19, player:int=0, variant:str="MRY", hfen:str=None):
+    def __init__(self, board:list=None, player:int=0, variant:str="MRY", hfen:str=None):
         if hfen is not None:
-            (boardstr, color, variant) = hfen.split()
-            # Strip slashes and replace ints with dashes.
-            boardstr = re.sub(r'\d', lambda x: '-'*int(x.group(0)), boardstr.replace('/',''))
-            board = [CHAR2INT[c] for c in boardstr]
-            player = COLORS.index(color)
+            parse_hfen(hfen, self.board, &self.player, &self.variant_idx)
+        else:
+            if board is None:
+                board = [0]*19
+            if len(board) != 19:
+                raise ValueError('Invalid board. Must have 19 cells.')
+            if any(not 0 <= value < 13 for value in board):
+                raise ValueError('Invalid board. Cell values must be in range [0,12].')
+            if not 0 <= player < 6:
+                raise ValueError('Invalid player. Must be in range [0,5].')
+            if variant not in VARIANTS:
+                raise ValueError(f'Invalid variant "{variant}". Must be one of {VARIANTS}.')
+            for i in range(19): self.board[i] = board[i]
+            self.player = player
+            self.variant_idx = VARIANTS.index(variant)
+        self.sync_occupied()
+        self.sync_zobrist()
 
-        for i in range(19): self.board[i] = board[i]
-        self.player = player
-        self.variant = variant
+    def __dealloc__(self):
+        free(self.history)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void sync_occupied(self):
+        """Rebuild the per-color bitboards from the board."""
+        cdef unsigned char i, c
+        for c in range(6): self.occupied[c] = 0
+        for i in range(19):
+            for c in range(6):
+                if CELL_COLORS[self.board[i]] & (1 << c):
+                    self.occupied[c] |= 1 << i
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void sync_zobrist(self):
+        """Recompute the Zobrist key from scratch."""
+        cdef unsigned char i
+        self.zobrist = ZOBRIST_PLAYERS[self.player] ^ ZOBRIST_VARIANTS[self.variant_idx]
+        for i in range(19):
+            self.zobrist ^= ZOBRIST_CELLS[i][self.board[i]]
+
+    @property
+    def key(self) -> int:
+        """64-bit Zobrist key of the position. Equal states have equal keys."""
+        return self.zobrist
+
+    def __hash__(self):
+        cdef Py_hash_t h = <Py_hash_t>self.zobrist
+        return -2 if h == -1 else h
+
+    def __eq__(self, other):
+        if not isinstance(other, HexachromixState):
+            return NotImplemented
+        cdef HexachromixState state = other
+        return (
+            self.zobrist == state.zobrist
+            and self.player == state.player
+            and self.variant_idx == state.variant_idx
+            and memcmp(self.board, state.board, 19) == 0
+        )
 
     @property
     def hfen(self) -> str:
-        board = [INT2CHAR[self.board[i]] for i in range(19)]
-        board = '/'.join([''.join(board[i:j]) for i,j in [(0,3), (3,7), (7,12), (12,16), (16,19)]])
-        board = re.sub(r'-+', lambda x: str(len(x.group(0))), board)
-        return f'{board} {self.color} {self.variant}'
+        cdef char[32] s
+        cdef unsigned char i, value, row = 0, cells = 0, run = 0, n = 0
+        for i in range(19):
+            value = self.board[i]
+            if value == 0:
+                run += 1
+            else:
+                if run:
+                    s[n] = ord('0') + run
+                    n += 1
+                    run = 0
+                s[n] = CELL_CHARS[value]
+                n += 1
+            cells += 1
+            if cells == ROW_LENGTHS[row]:
+                if run:
+                    s[n] = ord('0') + run
+                    n += 1
+                    run = 0
+                s[n] = ord('/') if row < 4 else ord(' ')
+                n += 1
+                row += 1
+                cells = 0
+        s[n] = PLAYER_CHARS[self.player]
+        s[n+1] = ord(' ')
+        return s[:n+2].decode('ascii') + VARIANTS[self.variant_idx]
+
+    def to_bytes(self) -> bytes:
+        """11-byte encoding: the 19 cells and the player as 4-bit values (two per byte, low bits first), then the variant index."""
+        cdef unsigned char[11] data
+        cdef unsigned char i
+        for i in range(11): data[i] = 0
+        for i in range(19):
+            data[i >> 1] |= self.board[i] << (4 * (i & 1))
+        data[9] |= self.player << 4
+        data[10] = self.variant_idx
+        return (<char*>data)[:11]
+
+    @staticmethod
+    def from_bytes(const unsigned char[:] data) -> HexachromixState:
+        """The state encoded by to_bytes."""
+        if data.shape[0] != 11: raise ValueError('Invalid data. Must be 11 bytes.')
+        cdef HexachromixState state = HexachromixState.__new__(HexachromixState)
+        cdef unsigned char i
+        for i in range(19):
+            state.board[i] = (data[i >> 1] >> (4 * (i & 1))) & 0xF
+            if state.board[i] >= 13: raise ValueError(f'Invalid data. Cell {i} has value {state.board[i]}.')
+        state.player = data[9] >> 4
+        state.variant_idx = data[10]
+        if state.player >= 6: raise ValueError(f'Invalid data. Player {state.player}.')
+        if state.variant_idx >= 3: raise ValueError(f'Invalid data. Variant {state.variant_idx}.')
+        state.sync_occupied()
+        state.sync_zobrist()
+        return state
+
+    def __reduce__(self):
+        return (HexachromixState.from_bytes, (self.to_bytes(),))
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        """A read-only view of the board's cell values."""
+        if flags & PyBUF_WRITABLE:
+            raise BufferError('The board is read-only.')
+        buffer.buf = self.board
+        buffer.obj = self
+        buffer.len = 19
+        buffer.readonly = 1
+        buffer.itemsize = 1
+        buffer.format = NULL
+        if flags & PyBUF_FORMAT:
+            buffer.format = BOARD_FORMAT
+        buffer.ndim = 1
+        buffer.shape = BOARD_SHAPE
+        buffer.strides = NULL
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        pass
 
     @property
     def color(self) -> str: return COLORS[self.player]
 
-    @cython.boundscheck(False)
-    @cython.wraparound(False)
-    cpdef get_current_team(self):
-        if self.variant == "MRY":
-            if self.player in [5,0,1]:
-                return "MRY"
-            else:
-                return "GCB"
-        elif self.variant == "MR":
-            if self.player in [5,0]:
-                return "MR"
-            elif self.player in [1,2]:
-                return "YG"
-            else:
-                return "CB"
-        else:
-            return COLORS[self.player]
+    @property
+    def variant(self) -> str: return VARIANTS[self.variant_idx]
+
+    cpdef get_current_team(self): return PLAYER_TEAMS[self.variant_idx][self.player]
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
     cpdef get_legal_moves(self):
         cdef unsigned char i, j, c, n = 0
         cdef unsigned char[19][2] moves
+        count(LEGAL_MOVE_GENERATIONS)
         for i in range(19):
             c = self.board[i]
             for j in range(4):
@@ -103,45 +341,321 @@ cdef class HexachromixState:
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
+    cdef bint has_legal_moves(self):
+        cdef unsigned char i, j
+        for i in range(19):
+            for j in range(4):
+                if self.board[i] == TRANSFORMATIONS[self.player][j][0]:
+                    return True
+        return False
+
+    cpdef unsigned char count_empty(self):
+        """Number of empty cells."""
+        cdef unsigned char i, n = 0
+        for i in range(19):
+            n += self.board[i] == 0
+        return n
+
+    cpdef HexachromixState copy(self):
+        """A copy of this state, without its undo history."""
+        cdef HexachromixState state = HexachromixState.__new__(HexachromixState)
+        count(MAKE_MOVE_ALLOCATIONS)
+        state.board = self.board
+        state.player = self.player
+        state.variant_idx = self.variant_idx
+        state.occupied = self.occupied
+        state.zobrist = self.zobrist
+        return state
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef inline void set_cell(self, unsigned char i, unsigned char value):
+        self.zobrist ^= ZOBRIST_CELLS[i][self.board[i]] ^ ZOBRIST_CELLS[i][value]
+        place(self.board, self.occupied, i, value)
+
+    cdef inline void set_player(self, unsigned char player):
+        self.zobrist ^= ZOBRIST_PLAYERS[self.player] ^ ZOBRIST_PLAYERS[player]
+        self.player = player
+
     cpdef HexachromixState make_move(self, (int,int) move):
-        cdef unsigned char i = move[0], c = move[1]
-        board = [self.board[i] for i in range(19)]
-        board[i] = c
-        return HexachromixState(board, (self.player+1)%6, self.variant)
+        if not (0 <= move[0] < 19 and 0 <= move[1] < 13): raise ValueError(f'Invalid move {move}.')
+        cdef HexachromixState state = self.copy()
+        state.set_cell(move[0], move[1])
+        state.set_player((self.player+1) % 6)
+        return state
 
-    cpdef bint is_terminal(self): return self.has_path() or len(self.get_legal_moves()) == 0
+    cpdef void apply(self, (int,int) move):
+        """Make the move in place. It can be taken back with undo."""
+        if not (0 <= move[0] < 19 and 0 <= move[1] < 13): raise ValueError(f'Invalid move {move}.')
+        cdef unsigned char *history
+        if self.n_history == self.history_size:
+            history = <unsigned char*>realloc(self.history, 2 * (self.history_size+32))
+            if history is NULL: raise MemoryError()
+            self.history = history
+            self.history_size += 32
+        self.history[2*self.n_history] = move[0]
+        self.history[2*self.n_history+1] = self.board[move[0]]
+        self.n_history += 1
+        self.set_cell(move[0], move[1])
+        self.set_player((self.player+1) % 6)
+
+    cpdef void undo(self):
+        """Take back the last move made with apply."""
+        if self.n_history == 0: raise IndexError('No moves to undo.')
+        self.n_history -= 1
+        self.set_cell(self.history[2*self.n_history], self.history[2*self.n_history+1])
+        self.set_player((self.player+5) % 6)
+
+    cpdef bint is_terminal(self): return self.has_path() or not self.has_legal_moves()
 
     cpdef get_reward(self): return 1 if self.has_path() else 0
 
-    cpdef bint has_path(self): return bfs((self.player-1)%6, self.board)
+    cpdef bint has_path(self): return flood((self.player-1)%6, self.occupied[(self.player-1)%6])
+
+    cpdef bint has_path_for(self, unsigned char color_idx):
+        """Whether the given color connects its two sides."""
+        if color_idx >= 6: raise ValueError(f'Invalid color index {color_idx}.')
+        return flood(color_idx, self.occupied[color_idx])
+
+    def _has_path_bfs(self, unsigned char color_idx):
+        """Reference implementation of has_path_for, kept for cross-checking the bitboards."""
+        if color_idx >= 6: raise ValueError(f'Invalid color index {color_idx}.')
+        return bfs(color_idx, self.board)
 
     cpdef Tuple[Hashable,HexachromixState] suggest_move(self):
-        cdef unsigned char i
-        cdef unsigned char[19] board
+        cdef unsigned int occupied = self.occupied[self.player]
 
         moves = self.get_legal_moves()
         for move in moves:
-            # Make a temp board to check for a path.
-            for i in range(19): board[i] = self.board[i]
-            board[move[0]] = move[1]
-            if bfs(self.player, board):
+            # Every legal move makes the mover occupy that cell, so just check the bitboard with it added.
+            if flood(self.player, occupied | (1 << <unsigned char>move[0])):
                 return (move, self.make_move(move))
 
         # If the above did not return a move, pick one at random.
         move = choice(moves)
         return (move, self.make_move(move))
 
+    def rollout(self, unsigned int n_playouts, seed:int=None) -> dict:
+        """Play n_playouts games to the end with the suggest_move policy, entirely in C.
+        Returns the number of games each team won (games missing from the total were draws).
+        The same seed always produces the same result.
+        """
+        cdef unsigned long long rng = getrandbits(64) if seed is None else seed
+        cdef unsigned int[6] wins = [0]*6
+        cdef unsigned int n
+        cdef int winner
+        cdef unsigned char[19] board
+        cdef unsigned int[6] occupied
+
+        with nogil:
+            for n in range(n_playouts):
+                board = self.board
+                occupied = self.occupied
+                winner = playout(board, occupied, self.player, &rng)
+                count(PLAYOUTS)
+                if winner >= 0:
+                    wins[winner] += 1
+
+        teams = PLAYER_TEAMS[self.variant_idx]
+        rewards = {team:0 for team in teams}
+        for c in range(6):
+            rewards[teams[c]] += wins[c]
+        return rewards
+
+    cdef HexachromixState transformed(self, unsigned char rotation, unsigned char shift):
+        cdef unsigned char i
+        cdef HexachromixState state = HexachromixState.__new__(HexachromixState)
+        for i in range(19):
+            state.board[ROTATIONS[rotation][i]] = COLOR_SHIFTS[shift][self.board[i]]
+        state.player = (self.player+shift) % 6
+        state.variant_idx = self.variant_idx
+        state.sync_occupied()
+        state.sync_zobrist()
+        return state
+
+    def symmetries(self):
+        """Yield (state, symmetry) for each symmetry that respects this variant's teams, starting with the identity."""
+        cdef unsigned char n
+        for n in range(N_VARIANT_SYMMETRIES[self.variant_idx]):
+            symmetry = Symmetry(VARIANT_SYMMETRIES[self.variant_idx][n][0], VARIANT_SYMMETRIES[self.variant_idx][n][1])
+            yield (symmetry.apply(self), symmetry)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def canonical(self) -> Tuple[HexachromixState,Symmetry]:
+        """The smallest equivalent state (comparing boards, then players), and the symmetry that maps this state onto it.
+        A move from the canonical state maps back to this state with symmetry.unmap_move.
+        """
+        cdef unsigned char i, n, rotation, shift, player, best_n = 0, best_player = self.player
+        cdef unsigned char[19] board, best = self.board
+        cdef int cmp
+        for n in range(1, N_VARIANT_SYMMETRIES[self.variant_idx]):
+            rotation = VARIANT_SYMMETRIES[self.variant_idx][n][0]
+            shift = VARIANT_SYMMETRIES[self.variant_idx][n][1]
+            for i in range(19):
+                board[ROTATIONS[rotation][i]] = COLOR_SHIFTS[shift][self.board[i]]
+            player = (self.player+shift) % 6
+            cmp = memcmp(board, best, 19)
+            if cmp < 0 or (cmp == 0 and player < best_player):
+                best = board
+                best_player = player
+                best_n = n
+        symmetry = Symmetry(VARIANT_SYMMETRIES[self.variant_idx][best_n][0], VARIANT_SYMMETRIES[self.variant_idx][best_n][1])
+        return (symmetry.apply(self), symmetry)
+
+    def get_unique_moves(self) -> list:
+        """Legal moves, keeping only the first of any moves that lead to equivalent states."""
+        seen = set()
+        moves = []
+        for move in self.get_legal_moves():
+            (state, _) = self.make_move(move).canonical()
+            if state not in seen:
+                seen.add(state)
+                moves.append(move)
+        return moves
+
     def get_result(self):
         if self.has_path():
-            prev = COLORS[(self.player - 1) % 6]
-            return f'{prev} {VARIANT_PLAYER_TEAM[self.variant][prev]}'
-        if len(self.get_legal_moves()) == 0:
+            prev = (self.player - 1) % 6
+            return f'{COLORS[prev]} {PLAYER_TEAMS[self.variant_idx][prev]}'
+        if not self.has_legal_moves():
             return 'DRAW'
         return None
 
     def __repr__(self): return self.hfen
 
 
+cdef class Symmetry:
+    """A rotation of the board together with a cyclic shift of the colors.
+    Args:
+        rotation (int): Number of 60 degree clockwise rotations.
+        shift (int): Number of places each color moves along COLORS. Must equal rotation mod 3.
+    """
+    cdef readonly unsigned char rotation, shift
+
+    def __init__(self, rotation:int=0, shift:int=0):
+        if not (0 <= rotation < 6 and 0 <= shift < 6) or (rotation - shift) % 3:
+            raise ValueError(f'Invalid symmetry ({rotation},{shift}).')
+        self.rotation = rotation
+        self.shift = shift
+
+    @property
+    def inverse(self) -> Symmetry: return Symmetry((6-self.rotation) % 6, (6-self.shift) % 6)
+
+    cpdef HexachromixState apply(self, HexachromixState state):
+        """The state transformed by this symmetry."""
+        cdef unsigned char n
+        for n in range(N_VARIANT_SYMMETRIES[state.variant_idx]):
+            if VARIANT_SYMMETRIES[state.variant_idx][n][0] == self.rotation and VARIANT_SYMMETRIES[state.variant_idx][n][1] == self.shift:
+                return state.transformed(self.rotation, self.shift)
+        raise ValueError(f'{self} does not respect the teams of variant {state.variant}.')
+
+    cpdef (int,int) map_move(self, (int,int) move):
+        """A move on the original state, as the equivalent move on the transformed state."""
+        return (ROTATIONS[self.rotation][move[0]], COLOR_SHIFTS[self.shift][move[1]])
+
+    cpdef (int,int) unmap_move(self, (int,int) move):
+        """A move on the transformed state, as the equivalent move on the original state."""
+        return (ROTATIONS[(6-self.rotation) % 6][move[0]], COLOR_SHIFTS[(6-self.shift) % 6][move[1]])
+
+    def __eq__(self, other):
+        if not isinstance(other, Symmetry):
+            return NotImplemented
+        return (self.rotation, self.shift) == (other.rotation, other.shift)
+
+    def __hash__(self): return hash((self.rotation, self.shift))
+
+    def __repr__(self): return f'Symmetry({self.rotation},{self.shift})'
+
+
+cdef class TranspositionTable:
+    """Fixed-size table mapping positions (by Zobrist key) to arbitrary values.
+    Each bucket holds two entries: one kept for the highest priority (e.g. visits or depth) and one always replaced.
+    Args:
+        size (int): Number of buckets, rounded up to a power of two.
+    """
+    cdef unsigned long long *keys
+    cdef unsigned int *priorities
+    cdef unsigned char *used
+    cdef list values
+    cdef unsigned long long mask
+    cdef readonly unsigned long long hits, misses, stores, replacements
+
+    def __cinit__(self, size:int=1<<16):
+        if size < 1: raise ValueError('Invalid size. Must be positive.')
+        cdef unsigned long long n = 1
+        while n < size: n <<= 1
+        self.mask = n - 1
+        self.keys = <unsigned long long*>malloc(2 * n * sizeof(unsigned long long))
+        self.priorities = <unsigned int*>malloc(2 * n * sizeof(unsigned int))
+        self.used = <unsigned char*>calloc(2 * n, sizeof(unsigned char))
+        if self.keys is NULL or self.priorities is NULL or self.used is NULL: raise MemoryError()
+        self.values = [None] * (2 * n)
+
+    def __dealloc__(self):
+        free(self.keys)
+        free(self.priorities)
+        free(self.used)
+
+    @property
+    def size(self) -> int: return self.mask + 1
+
+    def __len__(self):
+        cdef unsigned long long i, n = 0
+        for i in range(2 * (self.mask+1)):
+            n += self.used[i]
+        return n
+
+    cdef long long find(self, unsigned long long key):
+        cdef unsigned long long b = 2 * (key & self.mask)
+        if self.used[b] and self.keys[b] == key: return b
+        if self.used[b+1] and self.keys[b+1] == key: return b+1
+        return -1
+
+    cpdef get(self, HexachromixState state, default=None):
+        """The value stored for the state, or default."""
+        cdef long long i = self.find(state.zobrist)
+        if i < 0:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.values[i]
+
+    def __contains__(self, HexachromixState state): return self.find(state.zobrist) >= 0
+
+    cpdef void put(self, HexachromixState state, value, unsigned int priority=0):
+        """Store a value for the state. Higher-priority entries are less likely to be replaced."""
+        cdef unsigned long long key = state.zobrist
+        cdef unsigned long long b = 2 * (key & self.mask)
+        if self.used[b+1] and self.keys[b+1] == key:
+            self.used[b+1] = False
+            self.values[b+1] = None
+        if not self.used[b] or self.keys[b] == key or priority >= self.priorities[b]:
+            if self.used[b] and self.keys[b] != key:
+                # Demote the previous entry to the always-replace slot.
+                self.store(b+1, self.keys[b], self.values[b], self.priorities[b])
+            self.store(b, key, value, priority)
+        else:
+            self.store(b+1, key, value, priority)
+        self.stores += 1
+
+    cdef void store(self, unsigned long long i, unsigned long long key, value, unsigned int priority):
+        if i % 2 and self.used[i]:
+            # Only the always-replace slot ever loses an entry.
+            self.replacements += 1
+        self.used[i] = True
+        self.keys[i] = key
+        self.priorities[i] = priority
+        self.values[i] = value
+
+    def clear(self):
+        cdef unsigned long long i
+        for i in range(2 * (self.mask+1)):
+            self.used[i] = False
+            self.values[i] = None
+        self.hits = self.misses = self.stores = self.replacements = 0
+
+
 """  ——  ——  ——
    / 00  01  02 \
  / 03  04  05  06 \
@@ -184,6 +698,92 @@ cdef unsigned char[6][2][3] SIDES = [
 
 cdef unsigned char[6][3] OCCUPANTS = [[CHAR2INT[c] for c in chars] for chars in ['mRy','rYg','yGc','gCb','cBm','bMr']]
 
+
+# Bitboards. Bit i of a mask represents cell i.
+# CELL_COLORS[v] has bit c set if color c occupies a cell with value v.
+cdef unsigned char[13] CELL_COLORS
+cdef unsigned int[6][2] SIDE_MASKS
+# Neighbors of any set of cells, looked up in two halves: cells 0-9 and cells 10-18.
+cdef unsigned int[1024] EXPAND_LO
+cdef unsigned int[512] EXPAND_HI
+
+cdef unsigned int neighbor_mask(unsigned int cells):
+    cdef unsigned int idx, i, mask = 0
+    for idx in range(19):
+        if cells & (1 << idx):
+            for i in range(6):
+                if ADJACENCIES[idx][i] == 255: break
+                mask |= 1 << ADJACENCIES[idx][i]
+    return mask
+
+cdef unsigned int _i, _j
+for _i in range(13):
+    CELL_COLORS[_i] = 0
+    for _j in range(18):
+        if OCCUPANTS[_j//3][_j%3] == _i:
+            CELL_COLORS[_i] |= 1 << (_j//3)
+for _i in range(6):
+    for _j in range(2):
+        SIDE_MASKS[_i][_j] = (1 << SIDES[_i][_j][0]) | (1 << SIDES[_i][_j][1]) | (1 << SIDES[_i][_j][2])
+for _i in range(1024): EXPAND_LO[_i] = neighbor_mask(_i)
+for _i in range(512): EXPAND_HI[_i] = neighbor_mask(_i << 10)
+
+# Zobrist keys. A state's key is the XOR of the keys of its cell values, its player and its variant.
+cdef unsigned long long[19][13] ZOBRIST_CELLS
+cdef unsigned long long[6] ZOBRIST_PLAYERS
+cdef unsigned long long[3] ZOBRIST_VARIANTS
+cdef unsigned long long _seed = 0x4845584143485258 # Fixed, so keys are stable across processes.
+for _i in range(19):
+    for _j in range(13):
+        ZOBRIST_CELLS[_i][_j] = splitmix64(&_seed)
+for _i in range(6): ZOBRIST_PLAYERS[_i] = splitmix64(&_seed)
+for _i in range(3): ZOBRIST_VARIANTS[_i] = splitmix64(&_seed)
+
+# Symmetries. Rotating the board 60 degrees clockwise moves each color's sides onto the next color's sides,
+# so m rotations together with shifting every color k places along COLORS (k = m mod 3) leave the rules unchanged.
+# ROTATION[i] is the cell that cell i moves to.
+cdef unsigned char[19] ROTATION = [2,6,11,1,5,10,15,0,4,9,14,18,3,8,13,17,7,12,16]
+cdef unsigned char[6][19] ROTATIONS # ROTATIONS[m][i] is the cell that cell i moves to after m rotations.
+cdef unsigned char[6][13] COLOR_SHIFTS # COLOR_SHIFTS[k][v] is cell value v with its colors shifted k places.
+# The (rotations, shift) pairs that also keep each variant's teams together.
+cdef unsigned char[3][12][2] VARIANT_SYMMETRIES
+cdef unsigned char[3] N_VARIANT_SYMMETRIES
+
+for _i in range(19): ROTATIONS[0][_i] = _i
+for _i in range(1,6):
+    for _j in range(19):
+        ROTATIONS[_i][_j] = ROTATION[ROTATIONS[_i-1][_j]]
+for _i in range(6):
+    COLOR_SHIFTS[_i][0] = 0
+    for _j in range(6):
+        COLOR_SHIFTS[_i][1+_j] = 1 + (_j+_i) % 6
+        COLOR_SHIFTS[_i][7+_j] = 7 + (_j+_i) % 6
+for _i in range(3):
+    _teams = PLAYER_TEAMS[_i]
+    N_VARIANT_SYMMETRIES[_i] = 0
+    for _j in range(6):
+        # The shift must map teammates to teammates.
+        if all((_teams[a] == _teams[b]) == (_teams[(a+_j)%6] == _teams[(b+_j)%6]) for a in range(6) for b in range(6)):
+            for _m in (_j%3, _j%3+3):
+                VARIANT_SYMMETRIES[_i][N_VARIANT_SYMMETRIES[_i]][0] = _m
+                VARIANT_SYMMETRIES[_i][N_VARIANT_SYMMETRIES[_i]][1] = _j
+                N_VARIANT_SYMMETRIES[_i] += 1
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint flood(unsigned char color_idx, unsigned int occupied) noexcept nogil:
+    """Flood-fill the color's occupied cells from its starting side. True if the fill reaches the far side."""
+    cdef unsigned int grown, reached = occupied & SIDE_MASKS[color_idx][0]
+    count(PATH_CHECKS)
+    while reached:
+        if reached & SIDE_MASKS[color_idx][1]:
+            return True
+        grown = (reached | EXPAND_LO[reached & 0x3FF] | EXPAND_HI[reached >> 10]) & occupied
+        if grown == reached:
+            return False
+        reached = grown
+    return False
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 cdef bint bfs(unsigned char color_idx, unsigned char[19] board):
@@ -192,6 +792,7 @@ cdef bint bfs(unsigned char color_idx, unsigned char[19] board):
     cdef unsigned char[3] ends = SIDES[color_idx][1]
     cdef bint[19] visited = [False] * 19
     cdef unsigned char[19] frontier
+    count(PATH_CHECKS)
 
     # Initialize the frontier with the three starting indices.
     (frontier[0],frontier[1],frontier[2]) = SIDES[color_idx][0]
@@ -238,3 +839,209 @@ cdef bint bfs(unsigned char color_idx, unsigned char[19] board):
     # No path found.
     # print(f'NO PATH!\nfinal visited: {visited}\nfinal frontier: {[frontier[i] for i in range(19) if visited[i]]}')
     return False
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void place(unsigned char[19] board, unsigned int[6] occupied, unsigned char i, unsigned char value) noexcept nogil:
+    """Set cell i to the given value, keeping the bitboards in sync."""
+    cdef unsigned char c
+    board[i] = value
+    for c in range(6):
+        if CELL_COLORS[value] & (1 << c):
+            occupied[c] |= 1 << i
+        else:
+            occupied[c] &= ~(1 << i)
+
+
+# Native playouts.
+
+cdef inline unsigned long long splitmix64(unsigned long long *state) noexcept nogil:
+    """Advance the state and return the next pseudo-random 64-bit integer."""
+    state[0] += 0x9E3779B97F4A7C15ULL
+    cdef unsigned long long z = state[0]
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+    return z ^ (z >> 31)
+
+@cython.cdivision(True)
+cdef inline unsigned long long rand_below(unsigned long long *state, unsigned long long n) noexcept nogil:
+    """A pseudo-random integer in [0,n)."""
+    return splitmix64(state) % n
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef int playout(unsigned char[19] board, unsigned int[6] occupied, unsigned char player, unsigned long long *rng) noexcept nogil:
+    """Play the game out in place, following the same policy as suggest_move.
+    Returns the index of the winning color, or -1 for a draw.
+    """
+    cdef unsigned char i, j, c, prev, n, pick
+    cdef unsigned char[19][2] moves
+
+    while True:
+        # Terminal? (Same checks as is_terminal.)
+        prev = (player+5) % 6
+        if flood(prev, occupied[prev]):
+            return prev
+        n = 0
+        for i in range(19):
+            c = board[i]
+            for j in range(4):
+                if c == TRANSFORMATIONS[player][j][0]:
+                    moves[n][0] = i
+                    moves[n][1] = TRANSFORMATIONS[player][j][1]
+                    n += 1
+                    break
+        count(LEGAL_MOVE_GENERATIONS)
+        if n == 0:
+            return -1
+
+        # Take the first winning move, else a random one.
+        pick = n
+        for i in range(n):
+            if flood(player, occupied[player] | (1 << moves[i][0])):
+                pick = i
+                break
+        if pick == n:
+            pick = <unsigned char>rand_below(rng, n)
+
+        place(board, occupied, moves[pick][0], moves[pick][1])
+        player = (player+1) % 6
+
+
+# Batches. These take an (N,19) array of boards and an (N,) array of players (color indices) and return NumPy arrays.
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('The batch functions require numpy. Install with `pip install hexachromix[batch]`.')
+    return numpy
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t find_invalid(const unsigned char[:,:] boards, const unsigned char[:] players) noexcept nogil:
+    """Index of the first row with an invalid cell value or player, or -1."""
+    cdef Py_ssize_t n, i
+    for n in range(boards.shape[0]):
+        if players[n] >= 6:
+            return n
+        for i in range(19):
+            if boards[n,i] >= 13:
+                return n
+    return -1
+
+cdef void check_batch(const unsigned char[:,:] boards, const unsigned char[:] players) except *:
+    if boards.shape[1] != 19: raise ValueError(f'Invalid boards shape. Must be (N,19).')
+    if players.shape[0] != boards.shape[0]: raise ValueError(f'Invalid players shape. Must be (N,).')
+    cdef Py_ssize_t n
+    with nogil:
+        n = find_invalid(boards, players)
+    if n >= 0: raise ValueError(f'Invalid board or player in row {n}.')
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline unsigned int occupied_by(const unsigned char[:,:] boards, Py_ssize_t n, unsigned char color_idx) noexcept nogil:
+    cdef unsigned char i
+    cdef unsigned int occupied = 0
+    for i in range(19):
+        if CELL_COLORS[boards[n,i]] & (1 << color_idx):
+            occupied |= 1 << i
+    return occupied
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def batch_legal_moves(const unsigned char[:,:] boards, const unsigned char[:] players):
+    """(N,19) bool array: whether each cell is a legal move for the player to move."""
+    check_batch(boards, players)
+    result = _numpy().zeros((boards.shape[0],19), dtype=bool)
+    cdef unsigned char[:,::1] out = result.view('uint8')
+    cdef Py_ssize_t n
+    cdef unsigned char i, j
+    with nogil:
+        for n in range(boards.shape[0]):
+            for i in range(19):
+                for j in range(4):
+                    if boards[n,i] == TRANSFORMATIONS[players[n]][j][0]:
+                        out[n,i] = True
+                        break
+        count(LEGAL_MOVE_GENERATIONS, boards.shape[0])
+    return result
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def batch_has_path(const unsigned char[:,:] boards, const unsigned char[:] players):
+    """(N,) bool array: whether the previous player has a path (same as HexachromixState.has_path)."""
+    check_batch(boards, players)
+    result = _numpy().zeros(boards.shape[0], dtype=bool)
+    cdef unsigned char[::1] out = result.view('uint8')
+    cdef Py_ssize_t n
+    cdef unsigned char prev
+    with nogil:
+        for n in range(boards.shape[0]):
+            prev = (players[n]+5) % 6
+            out[n] = flood(prev, occupied_by(boards, n, prev))
+    return result
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def batch_is_terminal(const unsigned char[:,:] boards, const unsigned char[:] players):
+    """(N,) bool array: whether each game is over (same as HexachromixState.is_terminal)."""
+    check_batch(boards, players)
+    result = _numpy().ones(boards.shape[0], dtype=bool)
+    cdef unsigned char[::1] out = result.view('uint8')
+    cdef Py_ssize_t n
+    cdef unsigned char i, j, prev
+    with nogil:
+        for n in range(boards.shape[0]):
+            prev = (players[n]+5) % 6
+            if flood(prev, occupied_by(boards, n, prev)):
+                continue
+            out[n] = False
+            for i in range(19):
+                for j in range(4):
+                    if boards[n,i] == TRANSFORMATIONS[players[n]][j][0]:
+                        break
+                else:
+                    continue
+                break
+            else:
+                # No legal moves.
+                out[n] = True
+    return result
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def batch_make_moves(const unsigned char[:,:] boards, const unsigned char[:] players, const unsigned char[:] cells):
+    """Play the player to move on the given cell of each board.
+    Returns the new (N,19) uint8 boards and the new (N,) uint8 players.
+    """
+    check_batch(boards, players)
+    if cells.shape[0] != boards.shape[0]: raise ValueError(f'Invalid cells shape. Must be (N,).')
+    np = _numpy()
+    new_boards = np.array(boards, dtype='uint8', order='C')
+    new_players = np.empty(boards.shape[0], dtype='uint8')
+    cdef unsigned char[:,::1] out_boards = new_boards
+    cdef unsigned char[::1] out_players = new_players
+    cdef Py_ssize_t n, illegal = -1
+    cdef unsigned char i, j
+    with nogil:
+        for n in range(boards.shape[0]):
+            i = cells[n]
+            if i >= 19:
+                illegal = n
+                break
+            for j in range(4):
+                if boards[n,i] == TRANSFORMATIONS[players[n]][j][0]:
+                    out_boards[n,i] = TRANSFORMATIONS[players[n]][j][1]
+                    break
+            else:
+                illegal = n
+                break
+            out_players[n] = (players[n]+1) % 6
+    if illegal >= 0: raise ValueError(f'Illegal move in row {illegal}.')
+    return (new_boards, new_players)
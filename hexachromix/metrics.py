@@ -0,0 +1,65 @@
+"""Metrics in the Prometheus text exposition format, and the core counters of worker processes."""
+import bisect
+from typing import Optional, List, Dict
+
+from . import core
+
+
+def labels(values:Optional[Dict[str,str]]) -> str:
+    if not values:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k,v in values.items()) + '}'
+
+def metric(name:str, kind:str, help:str, samples:Dict[Optional[str],float], label:Optional[str]=None) -> List[str]:
+    """Lines for a gauge or counter. samples maps a label value (None if unlabeled) to the value."""
+    lines = [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+    for value,sample in samples.items():
+        lines.append(f'{name}{labels({label:value} if label else None)} {sample}')
+    return lines
+
+
+class Histogram:
+    """Observations counted into buckets (upper bounds), with a series per value of an optional label."""
+    def __init__(self, name:str, help:str, buckets:List[float], label:Optional[str]=None):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self.label = label
+        self.series = {} # label value -> (bucket counts, sum)
+
+    def observe(self, value:float, label:Optional[str]=None):
+        (counts, total) = self.series.get(label, ([0]*(len(self.buckets)+1), 0))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.series[label] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label,(counts,total) in sorted(self.series.items(), key=lambda item:str(item[0])):
+            base = {self.label:label} if self.label else {}
+            cumulative = 0
+            for bound,n in zip(self.buckets + ['+Inf'], counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{labels({**base, "le":bound})} {cumulative}')
+            lines.append(f'{self.name}_sum{labels(base)} {total}')
+            lines.append(f'{self.name}_count{labels(base)} {cumulative}')
+        return lines
+
+
+def use_slot(slots, slot:int):
+    """Enable the core counters, kept in the given slot of a shared array of len(core.COUNTERS) counters per slot."""
+    n = len(core.COUNTERS)
+    if (slot+1)*n <= len(slots):
+        core.use_counters(memoryview(slots)[slot*n:(slot+1)*n])
+        core.enable_counters()
+
+def init_worker(slots, next_slot):
+    """Process pool initializer: claim the next free slot of the shared counters."""
+    with next_slot.get_lock():
+        slot = next_slot.value
+        next_slot.value += 1
+    use_slot(slots, slot)
+
+def total_counters(slots) -> Dict[str,int]:
+    """The counters summed over all slots."""
+    n = len(core.COUNTERS)
+    return {name:sum(slots[i::n]) for i,name in enumerate(core.COUNTERS)}
@@ -0,0 +1,119 @@
+"""Searches that can run in worker processes.
+They take and return plain data (HFENs, numbers, dicts) so they can be sent between processes.
+"""
+import random
+from time import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, List, Tuple
+
+from multimcts import MCTS
+
+from .core import HexachromixState, add_count
+from .tree import SearchTree
+
+
+def best(hfen:str, exploration_bias:float=1, rave_bias:float=1, pruning_bias:float=0, max_iterations:Optional[int]=None, max_time:Optional[float]=None) -> str:
+    """The HFEN of the state after the best move."""
+    mcts = MCTS(exploration_bias=exploration_bias, rave_bias=rave_bias, pruning_bias=pruning_bias)
+    state = HexachromixState(hfen=hfen)
+    best = mcts.search(state, max_iterations=max_iterations, max_time=max_time, return_type='node')
+    count_expanded(best.get_parent())
+    return best.get_state().hfen
+
+def count_expanded(root):
+    """Count a multimcts search's expanded nodes as the root's visits: each iteration expands at most one node."""
+    add_count('nodes_expanded', root.get_visits())
+
+def analysis(hfen:str, exploration_bias:float=1, rave_bias:float=1, pruning_bias:float=0, max_iterations:Optional[int]=None, max_time:Optional[float]=None, seed:Optional[int]=None) -> List[dict]:
+    """Info about each legal move (the resulting HFEN, visits and average reward), sorted best first."""
+    if seed is not None:
+        random.seed(seed)
+    mcts = MCTS(exploration_bias=exploration_bias, rave_bias=rave_bias, pruning_bias=pruning_bias)
+    state = HexachromixState(hfen=hfen)
+
+    # Find the best child node.
+    best = mcts.search(state, max_iterations=max_iterations, max_time=max_time, return_type='node')
+
+    # Back up to the parent, gather info about all children (best's siblings).
+    parent = best.get_parent()
+    count_expanded(parent)
+    children = [
+        {
+            'hfen': n.get_state().hfen,
+            'visits': n.get_visits(),
+            'reward': n.get_avg_reward(),
+        }
+        for n in parent.get_children().values()
+    ]
+    # Sort by visits and reward.
+    children.sort(key=lambda n:(n['visits'],n['reward']), reverse=True)
+
+    return children
+
+def timed_analysis(hfen:str, **kwargs) -> Tuple[List[dict], float]:
+    """analysis, along with the seconds it took."""
+    start = time()
+    children = analysis(hfen, **kwargs)
+    return (children, time() - start)
+
+def merge(analyses:List[List[dict]]) -> List[dict]:
+    """Combine analyses of the same state: visits are summed and rewards are averaged, weighted by visits."""
+    totals = {}
+    for children in analyses:
+        for child in children:
+            (visits, reward) = totals.get(child['hfen'], (0, 0))
+            totals[child['hfen']] = (visits + child['visits'], reward + child['visits']*child['reward'])
+    children = [
+        {
+            'hfen': hfen,
+            'visits': visits,
+            'reward': reward/visits if visits else 0,
+        }
+        for hfen,(visits,reward) in totals.items()
+    ]
+    children.sort(key=lambda n:(n['visits'],n['reward']), reverse=True)
+    return children
+
+def best_of(children:List[dict]) -> str:
+    """The HFEN of the child with the highest average reward (the same choice MCTS.search makes)."""
+    return max(children, key=lambda n:n['reward'])['hfen']
+
+def parallel_analysis(hfen:str, workers:int, executor:Optional[Executor]=None, seed:Optional[int]=None, **kwargs) -> List[dict]:
+    """Run independent analyses in separate processes and merge them.
+    Each worker gets the full budget (kwargs are passed to analysis) and its own seed.
+    """
+    if workers < 1: raise ValueError('Invalid workers. Must be positive.')
+    if seed is None:
+        seed = random.getrandbits(32)
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return parallel_analysis(hfen, workers, executor, seed, **kwargs)
+    futures = [executor.submit(analysis, hfen, seed=seed+i, **kwargs) for i in range(workers)]
+    return merge([future.result() for future in futures])
+
+def stream_analysis(hfen:str, updates, stop, exploration_bias:float=1, rave_bias:float=1, pruning_bias:float=0, max_iterations:Optional[int]=None, max_time:Optional[float]=None, every_iterations:Optional[int]=None, every_time:Optional[float]=0.1):
+    """Search in slices of every_iterations and/or every_time (seconds), putting the current analysis (as from analysis) on the updates queue after each slice.
+    Stops once the budget is spent or the stop event is set, then puts None.
+    """
+    try:
+        if max_iterations is None and max_time is None:
+            raise ValueError('At least one of [max_iterations,max_time] is required.')
+        if every_iterations is None and every_time is None:
+            raise ValueError('At least one of [every_iterations,every_time] is required.')
+        tree = SearchTree(HexachromixState(hfen=hfen), exploration_bias, rave_bias, pruning_bias)
+        end_time = None if max_time is None else time() + max_time
+        iterations = 0
+        while not stop.is_set():
+            # The slice ends at the next update or the end of the budget, whichever comes first.
+            slice_iterations = every_iterations
+            if max_iterations is not None:
+                slice_iterations = min(slice_iterations or max_iterations, max_iterations - iterations)
+            slice_time = every_time
+            if end_time is not None:
+                slice_time = max(0, min(slice_time or max_time, end_time - time()))
+            iterations += tree.search(max_iterations=slice_iterations, max_time=slice_time)
+            updates.put(tree.get_children())
+            if (max_iterations is not None and iterations >= max_iterations) or (end_time is not None and time() >= end_time):
+                break
+    finally:
+        updates.put(None)
@@ -0,0 +1,44 @@
+"""Search trees kept between requests, for analysis sessions.
+Each worker process holds its own trees, so every call for a session must go to the worker that created it.
+"""
+from typing import Optional
+
+from .core import HexachromixState
+from .tree import SearchTree
+
+
+trees = {} # id -> SearchTree
+
+def info(id:str) -> dict:
+    """The session's root HFEN, root visits, node count and the analysis of each legal move."""
+    tree = trees[id]
+    return {
+        'id': id,
+        'hfen': tree.get_state().hfen,
+        'visits': tree.get_visits(),
+        'nodes': tree.get_nodes(),
+        'children': tree.get_children(),
+    }
+
+def create(id:str, hfen:str, exploration_bias:float=1, rave_bias:float=1, pruning_bias:float=0) -> dict:
+    trees[id] = SearchTree(HexachromixState(hfen=hfen), exploration_bias, rave_bias, pruning_bias)
+    return info(id)
+
+def search(id:str, max_iterations:Optional[int]=None, max_time:Optional[float]=None) -> dict:
+    """Continue searching from the retained tree."""
+    trees[id].search(max_iterations=max_iterations, max_time=max_time)
+    return info(id)
+
+def move(id:str, hfen:Optional[str]=None) -> dict:
+    """Make hfen (the state after a legal move) the new root, or play the best move if hfen is None.
+    The matching subtree is kept and the rest is freed.
+    """
+    tree = trees[id]
+    if hfen is None:
+        tree.advance(tree.best('move'))
+    else:
+        tree.advance_to(HexachromixState(hfen=hfen))
+    return info(id)
+
+def delete(id:str):
+    trees.pop(id, None)
@@ -0,0 +1,135 @@
+"""Exact search of endgames, proving which team wins with best play.
+Values are from the point of view of the team to move at the root: 1 (win), 0 (draw) or -1 (loss).
+With more than two teams, the other teams are assumed to play together against it, so a win is a forced win against any play.
+Cells can change color indefinitely, so games have no fixed length. Each search looks a limited number of plies ahead and scores positions at its horizon once as losses and once as wins.
+When both give the same value, it is the exact value.
+"""
+from time import time
+from typing import Optional
+
+from .core import HexachromixState, TranspositionTable, VARIANT_PLAYER_TEAM
+
+WIN, DRAW, LOSS = 1, 0, -1
+RESULTS = {WIN:'win', DRAW:'draw', LOSS:'loss'}
+
+
+class Timeout(Exception):
+    pass
+
+
+class Solver:
+    """Iterative-deepening alpha-beta search with a transposition table.
+    Args:
+        tt_size (int): Transposition table entries per horizon value.
+    """
+    def __init__(self, tt_size:int=1<<18):
+        self.tables = {LOSS:TranspositionTable(tt_size), WIN:TranspositionTable(tt_size)}
+        self.nodes = 0
+
+    def solve(self, state:HexachromixState, max_plies:int=32, max_time:Optional[float]=None) -> dict:
+        """Search deeper and deeper until the value is proven, max_plies is reached or max_time (seconds) runs out.
+        Returns the result for the team to move ('win', 'draw', 'loss', or None if unproven), the best move and the HFEN after it, the plies searched and the nodes visited.
+        """
+        state = state.copy()
+        self.team = state.get_current_team()
+        self.end_time = None if max_time is None else time() + max_time
+        self.nodes = 0
+        for table in self.tables.values():
+            table.clear()
+        if state.is_terminal():
+            raise ValueError('The game is over.')
+        if max_plies < 1:
+            raise ValueError('Invalid max_plies. Must be positive.')
+        solution = {'result':None, 'move':None, 'hfen':None}
+        plies = 0
+        try:
+            for plies in range(1, max_plies+1):
+                # Scoring the horizon as a loss gives a lower bound on the value, and its best move guarantees it.
+                # Scoring it as a win gives an upper bound. The value is proven when they agree (a win needs only the first).
+                (low, move) = self.search(state, plies, LOSS, WIN, LOSS)
+                if low == WIN or low == self.search(state, plies, LOSS, WIN, WIN)[0]:
+                    solution.update(result=RESULTS[low], move=move, hfen=state.make_move(move).hfen)
+                    break
+        except Timeout:
+            plies -= 1
+        solution.update(plies=plies, nodes=self.nodes)
+        return solution
+
+    def search(self, state:HexachromixState, plies:int, alpha:int, beta:int, horizon:int):
+        """Alpha-beta search returning (value, best move). Positions plies moves ahead are given the horizon value."""
+        self.nodes += 1
+        if self.end_time is not None and self.nodes % 1024 == 0 and time() > self.end_time:
+            raise Timeout()
+        if plies == 0:
+            return (horizon, None)
+        moves = state.get_legal_moves()
+        table = self.tables[horizon]
+        entry = table.get(state)
+        best_move = None
+        if entry is not None:
+            (entry_plies, lower, upper, best_move) = entry
+            # Looking further ahead can only move a value away from the horizon value,
+            # so a shallower entry's bound on the other side still holds.
+            if entry_plies < plies:
+                if horizon == LOSS:
+                    upper = WIN
+                else:
+                    lower = LOSS
+            if lower >= beta or lower == upper:
+                return (lower, best_move)
+            if upper <= alpha:
+                return (upper, best_move)
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+        maximizing = state.get_current_team() == self.team
+        value = LOSS - 1 if maximizing else WIN + 1
+        (alpha0, beta0) = (alpha, beta)
+
+        # Move ordering: the stored best move, then moves that connect right away.
+        ordered = []
+        for move in moves:
+            state.apply(move)
+            if state.has_path():
+                ordered.insert(0, move)
+            else:
+                ordered.append(move)
+            state.undo()
+        if best_move in moves:
+            ordered.remove(best_move)
+            ordered.insert(0, best_move)
+
+        for move in ordered:
+            state.apply(move)
+            if state.has_path():
+                child = WIN if maximizing else LOSS
+            elif state.is_terminal():
+                child = DRAW
+            else:
+                (child, _) = self.search(state, plies-1, alpha, beta, horizon)
+            state.undo()
+            if (maximizing and child > value) or (not maximizing and child < value):
+                (value, best_move) = (child, move)
+            if maximizing:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        lower = value if value > alpha0 else LOSS
+        upper = value if value < beta0 else WIN
+        table.put(state, (plies, lower, upper, best_move), plies)
+        return (value, best_move)
+
+
+def decisive(solution:dict, state:HexachromixState) -> bool:
+    """Whether to play the solution's move rather than search: it forces a win, or a draw when there are only two teams.
+    With more teams, draws and losses assume the other teams play together, so they don't prove anything.
+    """
+    if solution['result'] == 'win':
+        return True
+    return solution['result'] == 'draw' and len(set(VARIANT_PLAYER_TEAM[state.variant].values())) == 2
+
+def solve(hfen:str, max_plies:int=32, max_time:Optional[float]=None) -> dict:
+    """Solver.solve for the state with the given HFEN, for running in worker processes."""
+    return Solver(1<<16).solve(HexachromixState(hfen=hfen), max_plies=max_plies, max_time=max_time)
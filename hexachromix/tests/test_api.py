@@ -0,0 +1,213 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from hexachromix import api, core
+from hexachromix.core import HexachromixState
+
+# A small pool, so a few long searches fill the queue.
+SETTINGS = {'WORKERS':1, 'MAX_QUEUE':3, 'MAX_TIME':3, 'MAX_ITERATIONS':1_000_000, 'CACHE_PATH':None, 'BOOK_PATH':None, 'COUNT':False, 'SOLVER_EMPTY':-1}
+LONG = {'max_iterations':10**9, 'max_time':3}
+
+class TestApi(TestCase):
+    def setUp(self):
+        patches = [patch.object(api, name, value) for name,value in SETTINGS.items()]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        api.active.clear()
+        api.jobs.clear()
+        api.cancelled.clear()
+        api.sessions.clear()
+
+    def client(self):
+        return TestClient(api.app)
+
+    def wait_for_job(self, client, id:str, statuses, timeout:float=60) -> dict:
+        end = time.time() + timeout
+        while time.time() < end:
+            job = client.get(f'/jobs/{id}').json()
+            if job['status'] in statuses:
+                return job
+            time.sleep(0.05)
+        self.fail(f'Job {id} still {job["status"]}.')
+
+    def test_budget(self):
+        with patch.object(api, 'MAX_TIME', 0.5), patch.object(api, 'MAX_ITERATIONS', 100):
+            self.assertEqual(api.budget('3/4/5/4/3 R MRY', api.MCTSParams(max_iterations=10**9)), {'exploration_bias':1, 'rave_bias':1, 'max_iterations':100, 'max_time':0.5})
+            self.assertEqual(api.budget('3/4/5/4/3 R MRY', api.MCTSParams(max_time=60, exploration_bias=2))['max_time'], 0.5)
+            self.assertEqual(api.budget('3/4/5/4/3 R MRY', api.MCTSParams(max_iterations=10, max_time=0.1)), {'exploration_bias':1, 'rave_bias':1, 'max_iterations':10, 'max_time':0.1})
+        for params in [api.MCTSParams(), api.MCTSParams(max_iterations=10, workers=2), api.MCTSParams(max_iterations=10, workers=0)]:
+            with self.assertRaises(HTTPException) as context: api.budget('3/4/5/4/3 R MRY', params)
+            self.assertEqual(context.exception.status_code, 400)
+        with self.assertRaises(HTTPException): api.budget('3/4/5/4 R MRY', api.MCTSParams(max_iterations=10))
+        # Finished games and negative or zero budgets never reach a worker.
+        for (hfen, params) in [
+            ('RRR/RRRR/RRRRR/RRRR/RRR Y MRY', api.MCTSParams(max_iterations=10)),
+            ('3/4/5/4/3 R MRY', api.MCTSParams(max_iterations=-1)),
+            ('3/4/5/4/3 R MRY', api.MCTSParams(max_time=0)),
+            ('3/4/5/4/3 R MRY', api.MCTSParams(max_iterations=10, max_time=-1)),
+        ]:
+            with self.assertRaises(HTTPException) as context: api.budget(hfen, params)
+            self.assertEqual(context.exception.status_code, 400)
+        self.assertEqual(api.budget('3/4/5/4/3 R MRY', api.MCTSParams(max_iterations=0))['max_iterations'], 0)
+
+    def test_broken_pool(self):
+        with self.client() as client:
+            self.assertEqual(client.get('/analysis/', params={'max_iterations':10}).status_code, 200)
+            self.assertEqual(client.get('/best/', params={'hfen':'RRR/RRRR/RRRRR/RRRR/RRR Y MRY', 'max_iterations':10}).status_code, 400)
+            # A worker dying breaks the pool, which is replaced on the next search.
+            broken = api.pool
+            for process in list(broken._processes.values()):
+                process.kill()
+            end = time.time() + 30
+            while not broken._broken and time.time() < end:
+                time.sleep(0.05)
+            self.assertTrue(broken._broken)
+            response = client.get('/analysis/', params={'max_iterations':20})
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNot(api.pool, broken)
+
+    def test_jobs(self):
+        with self.client() as client:
+            response = client.post('/jobs', json={'kind':'analysis', 'mcts_params':{'max_iterations':100}})
+            self.assertEqual(response.status_code, 202)
+            job = self.wait_for_job(client, response.json()['id'], ['done','failed'])
+            self.assertEqual(job['status'], 'done')
+            self.assertEqual(len(job['result']), 19)
+            self.assertEqual(sum(child['visits'] for child in job['result']), 100)
+            # Cancelling a finished job changes nothing.
+            self.assertEqual(client.delete(f'/jobs/{job["id"]}').json()['status'], 'done')
+
+            job = client.post('/jobs', json={'kind':'best', 'hfen':'R2/4/5/4/3 Y MRY', 'mcts_params':{'max_iterations':100}}).json()
+            job = self.wait_for_job(client, job['id'], ['done','failed'])
+            state = HexachromixState(hfen='R2/4/5/4/3 Y MRY')
+            self.assertIn(job['result'], [state.make_move(move).hfen for move in state.get_legal_moves()])
+
+            self.assertEqual(client.get('/jobs/missing').status_code, 404)
+            self.assertEqual(client.post('/jobs', json={'hfen':'3/4/5/4 R MRY', 'mcts_params':{'max_iterations':10}}).status_code, 400)
+
+    def test_queue(self):
+        with self.client() as client:
+            # The worker takes the first search and the pool hands it the next, so the third waits in the queue.
+            ids = [client.post('/jobs', json={'mcts_params':LONG}).json()['id'] for _ in range(3)]
+            self.wait_for_job(client, ids[0], ['running'])
+            self.assertEqual(client.get(f'/jobs/{ids[2]}').json()['status'], 'queued')
+
+            response = client.post('/jobs', json={'mcts_params':LONG})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(client.get('/analysis/', params={'max_iterations':10}).status_code, 429)
+
+            # Cancelling the queued job frees its place.
+            self.assertEqual(client.delete(f'/jobs/{ids[2]}').json()['status'], 'cancelled')
+            self.assertEqual(len(api.active), 2)
+            # A running job is reported cancelled right away, though its search runs to its budget.
+            self.assertEqual(client.delete(f'/jobs/{ids[0]}').json()['status'], 'cancelled')
+            self.assertEqual(client.get(f'/jobs/{ids[0]}').json(), {'id':ids[0], 'kind':'analysis', 'status':'cancelled', 'result':None, 'error':None})
+            self.assertEqual(client.delete(f'/jobs/{ids[1]}').json()['status'], 'cancelled')
+
+    def test_stream_analysis(self):
+        with self.client() as client:
+            with client.stream('GET', '/analysis/stream/', params={'max_iterations':2000, 'every_iterations':500}) as response:
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.headers['content-type'].startswith('text/event-stream'))
+                events = [line[len('event: '):] for line in response.iter_lines() if line.startswith('event: ')]
+            self.assertEqual(events[-1], 'done')
+            self.assertGreaterEqual(events.count('analysis'), 4)
+            for params in [{'workers':2}, {'hfen':'RRR/RRRR/RRRRR/RRRR/RRR Y MRY'}, {'every_iterations':0}, {'every_ms':0}, {'max_iterations':-1}]:
+                self.assertEqual(client.get('/analysis/stream/', params={'max_iterations':10, **params}).status_code, 400, params)
+            # More streams than the default thread pool has threads can wait in the queue at once.
+            def stream(_):
+                with client.stream('GET', '/analysis/stream/', params={'max_iterations':200, 'every_iterations':100}) as response:
+                    return [line for line in response.iter_lines() if line.startswith('event: ')][-1]
+            with patch.object(api, 'MAX_QUEUE', 40), ThreadPoolExecutor(40) as threads:
+                self.assertEqual(set(threads.map(stream, range(40))), {'event: done'})
+
+    def test_sessions(self):
+        with self.client() as client:
+            response = client.post('/sessions', json={'mcts_params':{'max_iterations':200}})
+            self.assertEqual(response.status_code, 201)
+            session = response.json()
+            (id, child) = (session['id'], session['children'][0])
+            self.assertEqual((session['hfen'], session['visits'], len(session['children'])), ('3/4/5/4/3 R MRY', 200, 19))
+
+            session = client.post(f'/sessions/{id}/search', json={'max_iterations':100}).json()
+            self.assertEqual(session['visits'], 300)
+
+            # Playing a move keeps its subtree.
+            session = client.post(f'/sessions/{id}/move', json={'hfen':child['hfen']}).json()
+            self.assertEqual(session['hfen'], child['hfen'])
+            self.assertGreaterEqual(session['visits'], child['visits'])
+            # A state that isn't a move away is rejected, and the session is unchanged.
+            for hfen in ['3/4/5/4/3 R MRY', child['hfen'], '3/4/5/4 R MRY']:
+                self.assertEqual(client.post(f'/sessions/{id}/move', json={'hfen':hfen}).status_code, 400, hfen)
+            self.assertEqual(client.get(f'/sessions/{id}').json(), session)
+            session = client.post(f'/sessions/{id}/move', json={}).json()
+            self.assertEqual(HexachromixState(hfen=session['hfen']).color, 'G')
+
+            self.assertEqual(client.delete(f'/sessions/{id}').status_code, 204)
+            self.assertEqual(client.get(f'/sessions/{id}').status_code, 404)
+            self.assertEqual(client.post(f'/sessions/{id}/search', json={'max_iterations':10}).status_code, 404)
+            self.assertEqual(client.post('/sessions', json={'mcts_params':{'max_iterations':10, 'workers':2}}).status_code, 400)
+
+    def test_session_errors(self):
+        with self.client() as client:
+            response = client.post('/sessions', json={'hfen':'RRR/RRRR/RRRRR/RRRR/RRR Y MRY', 'mcts_params':{'max_iterations':10}})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(api.sessions, {})
+
+            # Searching after the winning move is rejected, and the session lives on.
+            id = client.post('/sessions', json={'hfen':'gbM/byyB/rYgyy/cmYr/mcg G MRY'}).json()['id']
+            session = client.post(f'/sessions/{id}/move', json={'hfen':'GbM/byyB/rYgyy/cmYr/mcg C MRY'}).json()
+            self.assertEqual(client.post(f'/sessions/{id}/search', json={'max_iterations':10}).status_code, 400)
+            self.assertEqual(client.get(f'/sessions/{id}').json(), session)
+            other = client.post('/sessions', json={'mcts_params':{'max_iterations':10}}).json()['id']
+            for budget in [{'max_iterations':-1}, {'max_time':0}, {}]:
+                self.assertEqual(client.post(f'/sessions/{other}/search', json=budget).status_code, 400, budget)
+
+            # Session searches count towards the queue.
+            ids = [client.post('/jobs', json={'mcts_params':LONG}).json()['id'] for _ in range(3)]
+            self.assertEqual(client.post(f'/sessions/{other}/search', json={'max_iterations':10}).status_code, 429)
+            self.assertEqual(client.post('/sessions', json={'mcts_params':{'max_iterations':10}}).status_code, 429)
+            for job in ids:
+                client.delete(f'/jobs/{job}')
+            self.assertEqual(client.post(f'/sessions/{other}/search', json={'max_iterations':10}).status_code, 200)
+
+            # A crashed session process loses its sessions, and is replaced.
+            broken = api.session_pools[0]
+            for process in list(broken._processes.values()):
+                process.kill()
+            end = time.time() + 30
+            while not broken._broken and time.time() < end:
+                time.sleep(0.05)
+            self.assertEqual(client.get(f'/sessions/{other}').status_code, 500)
+            self.assertEqual(api.sessions, {})
+            self.assertEqual(client.post('/sessions', json={'mcts_params':{'max_iterations':10}}).status_code, 201)
+
+    def test_solve(self):
+        with self.client() as client:
+            response = client.get('/solve/', params={'hfen':'gMC/C1y1/rmmr1/YGy1/BG1 C MRY', 'max_plies':2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['plies'], 2)
+            self.assertEqual(client.get('/solve/', params={'max_plies':0}).status_code, 400)
+            self.assertEqual(client.get('/solve/', params={'hfen':'R2/R3/R4/R3/R2 Y R'}).status_code, 400)
+
+    def test_metrics(self):
+        def cleanup():
+            core.enable_counters(False)
+            core.use_counters()
+            api.counter_slots = None
+        self.addCleanup(cleanup)
+        with patch.object(api, 'COUNT', True), self.client() as client:
+            self.assertEqual(client.get('/analysis/', params={'max_iterations':300}).status_code, 200)
+            response = client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            samples = dict(line.rsplit(' ', 1) for line in response.text.splitlines() if not line.startswith('#'))
+        self.assertEqual(samples['hexachromix_queue_capacity'], '3')
+        self.assertGreaterEqual(int(samples['hexachromix_request_duration_seconds_count{path="/analysis/"}']), 1)
+        self.assertEqual(samples['hexachromix_cache_requests_total{outcome="misses"}'], '1')
+        # Counted in the worker that searched.
+        self.assertEqual(int(samples['hexachromix_core_nodes_expanded_total']), 300)
+        self.assertGreater(int(samples['hexachromix_core_legal_move_generations_total']), 300)
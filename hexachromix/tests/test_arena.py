@@ -0,0 +1,76 @@
+import json
+import math
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from hexachromix import arena
+
+CONFIGS = [{'exploration_bias':1.414, 'rave_bias':0, 'pruning_bias':0}, {'exploration_bias':0.5, 'rave_bias':0, 'pruning_bias':0}]
+
+class TestArena(TestCase):
+    def test_schedule(self):
+        self.assertEqual(arena.teams('MR'), ['MR','YG','CB'])
+        games = [arena.schedule(game, ['MRY','R'], seed=10) for game in range(6)]
+        self.assertEqual(games, [('MRY',0,10), ('MRY',1,10), ('R',0,11), ('R',1,11), ('MRY',0,12), ('MRY',1,12)])
+
+    def test_play(self):
+        for variant in ['MRY','MR','R']:
+            record = arena.play(0, variant, 1, 3, CONFIGS, max_iterations=20)
+            self.assertEqual(record, arena.play(0, variant, 1, 3, CONFIGS, max_iterations=20))
+            state = arena.replay(record)
+            self.assertEqual(state.get_result(), record['result'])
+            # With the seats swapped, the first agent plays the second team.
+            winner = state.get_result().split()[1]
+            self.assertEqual(record['score'], 1 if arena.teams(variant).index(winner) % 2 == 1 else 0)
+        # The pair of games starts the same way.
+        record = arena.play(1, 'MRY', 0, 3, CONFIGS, max_iterations=20)
+        self.assertEqual(record['moves'][:2], arena.play(0, 'MRY', 1, 3, CONFIGS, max_iterations=20)['moves'][:2])
+        # Unfinished games are draws.
+        record = arena.play(0, 'MRY', 0, 3, CONFIGS, max_moves=4, max_iterations=20)
+        self.assertEqual((len(record['moves']), record['result'], record['score']), (4, None, 0.5))
+
+    def test_score(self):
+        score = arena.Score()
+        self.assertEqual(score.interval(), (-math.inf, math.inf))
+        for result in [1]*30 + [0.5]*40 + [0]*30:
+            score.add(result)
+        self.assertEqual((score.n, score.mean, score.elo()), (100, 0.5, 0))
+        (low, high) = score.interval()
+        self.assertAlmostEqual(low, -high)
+        self.assertLess(low, 0)
+        # Even results favor neither hypothesis over the other by much.
+        self.assertAlmostEqual(score.llr(-5, 5), 0)
+        self.assertIsNone(score.sprt(0, 20))
+
+        for _ in range(100):
+            score.add(1)
+        self.assertAlmostEqual(score.elo(), arena.elo(0.75))
+        self.assertAlmostEqual(arena.expected_score(score.elo()), 0.75)
+        self.assertEqual(score.sprt(0, 20), 'H1')
+        self.assertEqual(score.sprt(300, 400), 'H0')
+
+    def test_run(self):
+        with TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'arena.jsonl')
+            played = []
+            (score, result) = arena.run(path, CONFIGS, 4, ['MRY','R'], callback=lambda record,score: played.append(record['game']), max_iterations=20)
+            self.assertEqual((sorted(played), score.n, result), ([0,1,2,3], 4, None))
+
+            # An interrupted write is dropped and the game played again.
+            with open(path, 'a') as f:
+                f.write('{"game":4,"vari')
+            played.clear()
+            (score, _) = arena.run(path, CONFIGS, 6, ['MRY','R'], callback=lambda record,score: played.append(record['game']), max_iterations=20)
+            self.assertEqual((sorted(played), score.n), ([4,5], 6))
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(lines[0]['configs'], CONFIGS)
+            self.assertEqual(sorted(line['game'] for line in lines[1:]), list(range(6)))
+
+            with self.assertRaises(ValueError): arena.run(path, CONFIGS, 6, ['MR'], max_iterations=20)
+
+            # Stops as soon as the test concludes.
+            path = os.path.join(dir, 'sprt.jsonl')
+            (score, result) = arena.run(path, [CONFIGS[0], {**CONFIGS[0], 'exploration_bias':0.1}], 100, sprt=(0, 1000), alpha=0.5, beta=0.5, max_iterations=20)
+            self.assertIsNotNone(result)
+            self.assertLess(score.n, 100)
@@ -0,0 +1,23 @@
+from unittest import TestCase
+from hexachromix import bench
+from hexachromix.core import HexachromixState
+
+class TestBench(TestCase):
+    def test_perft(self):
+        for variant in ['MRY','MR','R']:
+            self.assertEqual([bench.perft(HexachromixState(variant=variant), d) for d in range(1, 5)], bench.PERFT[variant][:4])
+        # Finished games aren't continued.
+        self.assertEqual(bench.perft(HexachromixState(hfen='R2/R3/R4/R3/R2 Y R'), 2), 0)
+
+    def test_check(self):
+        results = {'perft':{'R':[19, 342]}, 'has_path_ns':100, 'playouts_per_sec':1000}
+        self.assertEqual(bench.check(results), [])
+        self.assertEqual(bench.check(results, {'has_path_ns':95, 'playouts_per_sec':1050}, threshold=0.1), [])
+        self.assertEqual(len(bench.check(results, {'has_path_ns':80, 'playouts_per_sec':1200}, threshold=0.1)), 2)
+        self.assertEqual(len(bench.check({'perft':{'R':[19, 341]}})), 1)
+
+    def test_mcts(self):
+        # Both the search the API uses and the one sessions use.
+        results = bench.bench_mcts(iterations=50)
+        self.assertEqual(set(results), {'mcts_iterations_per_sec', 'tree_iterations_per_sec'})
+        self.assertGreater(min(results.values()), 0)
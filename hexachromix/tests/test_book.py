@@ -0,0 +1,36 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from hexachromix import book
+from hexachromix.core import HexachromixState
+
+class TestBook(TestCase):
+    def test_positions(self):
+        for variant in ['MRY','MR','R']:
+            positions = book.positions(variant, 2)
+            self.assertEqual(positions[0], HexachromixState(variant=variant))
+            self.assertEqual(len(positions), len(set(positions)))
+            # Every position reachable within a move is there, up to symmetry.
+            start = HexachromixState(variant=variant)
+            for move in start.get_legal_moves():
+                self.assertIn(start.make_move(move).canonical()[0], positions)
+
+    def test_build(self):
+        with TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'book.bin')
+            self.assertEqual(book.build(path, ['MRY','R'], plies=2, max_iterations=50), len(book.positions('MRY', 2)) + len(book.positions('R', 2)))
+            self.assertEqual(os.path.getsize(path), len(book.MAGIC) + book.RECORD.size*len(book.Book(path)))
+
+            opening = book.Book(path)
+            for variant in ['MRY','R']:
+                start = HexachromixState(variant=variant)
+                for state in [start] + [start.make_move(move) for move in start.get_legal_moves()]:
+                    (move, visits, reward) = opening.probe(state)
+                    self.assertIn(move, state.get_legal_moves())
+            self.assertIsNone(opening.probe(HexachromixState(variant='MR')))
+            self.assertIsNone(opening.probe(HexachromixState(variant='R').make_move((9,1)).make_move((0,2))))
+            opening.close()
+
+            with open(path, 'wb') as f:
+                f.write(b'not a book')
+            with self.assertRaises(ValueError): book.Book(path)
@@ -0,0 +1,47 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from hexachromix.cache import ResultCache
+from hexachromix.core import HexachromixState
+
+CHILDREN = [{'hfen':'R2/4/5/4/3 Y MRY', 'visits':60, 'reward':0.5}, {'hfen':'2R/4/5/4/3 Y MRY', 'visits':40, 'reward':0.4}]
+
+class TestResultCache(TestCase):
+    def test_budget(self):
+        cache = ResultCache(1<<20)
+        key = ResultCache.key(HexachromixState().to_bytes(), 1, 1)
+        self.assertIsNone(cache.get(key, 100, 1))
+        cache.put(key, CHILDREN, 100, 0.5)
+        # Either limit being reached is enough.
+        self.assertEqual(cache.get(key, 100, 10), (CHILDREN, 100, 0.5))
+        self.assertIsNotNone(cache.get(key, 1000, 0.5))
+        self.assertIsNotNone(cache.get(key, 1000, 10))
+        self.assertIsNone(cache.get(ResultCache.key(HexachromixState().to_bytes(), 1, 0), 100, 1))
+        self.assertEqual(cache.stats(), {'hits':2, 'extensions':1, 'misses':2, 'entries':1, 'bytes':cache.bytes})
+
+    def test_eviction(self):
+        cache = ResultCache(1000)
+        for n in range(10):
+            cache.put(str(n), CHILDREN, 100, 1)
+        self.assertLessEqual(cache.bytes, 1000)
+        self.assertLess(len(cache.entries), 10)
+        self.assertIsNotNone(cache.get('9', 100, 1))
+        self.assertIsNone(cache.get('0', 100, 1))
+
+        # Using an entry keeps it.
+        cache = ResultCache(1000)
+        for n in range(10):
+            cache.put(str(n), CHILDREN, 100, 1)
+            cache.get('0', 100, 1)
+        self.assertIsNotNone(cache.get('0', 100, 1))
+
+    def test_persistence(self):
+        with TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'cache.sqlite')
+            cache = ResultCache(1<<20, path)
+            cache.put('key', CHILDREN, 100, 0.5)
+            cache.close()
+            # Entries are read back from disk even when too big to keep in memory.
+            cache = ResultCache(0, path)
+            self.assertEqual(cache.get('key', 100, 1), (CHILDREN, 100, 0.5))
+            cache.close()
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+from unittest import TestCase
+
+def cli(*args):
+    return subprocess.run([sys.executable, '-m', 'hexachromix.cli', *args], capture_output=True, text=True, timeout=300)
+
+class TestCli(TestCase):
+    def test_sim_workers_with_solver(self):
+        # Parallel searches and solved moves alternate near the end, so the tree has to follow the parallel searches' moves.
+        for _ in range(3):
+            run = cli('sim', '--workers', '2', '--max-iterations', '30', '--solver-empty', '4', '--hfen', 'gMC/C1y1/rmmr1/YGy1/BG1 C MRY')
+            self.assertEqual(run.returncode, 0, run.stderr)
+            self.assertIn('result=', run.stdout)
+
+    def test_solve(self):
+        run = cli('solve', '--hfen', 'gMC/C1y1/rmmr1/YGy1/BG1 C MRY', '--max-plies', '2')
+        self.assertEqual(run.returncode, 0, run.stderr)
+        run = cli('solve', '--max-plies', '0')
+        self.assertEqual(run.returncode, 2)
+        self.assertIn('--max-plies must be positive', run.stderr)
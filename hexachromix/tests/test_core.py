@@ -1,5 +1,13 @@
-from unittest import TestCase
-from hexachromix.core import HexachromixState
+import pickle
+from unittest import TestCase, skipUnless
+from random import Random, seed
+from hexachromix.core import HexachromixState, TranspositionTable, Symmetry, HFENError, COLORS
+from hexachromix import core
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class TestCore(TestCase):
     def setUp(self):
@@ -14,6 +22,58 @@ class TestCore(TestCase):
         self.assertEqual(HexachromixState(hfen='3/4/5/4/3 R MRY').hfen, '3/4/5/4/3 R MRY')
         self.assertEqual(HexachromixState(hfen='GC1/BMRC/2R1c/MMYY/1BY C MRY').hfen, 'GC1/BMRC/2R1c/MMYY/1BY C MRY')
 
+    def test_invalid_hfen(self):
+        for hfen,reason in [
+            ('3/4/5/4/4 R MRY', 'row 5 has more than 3 cells'),
+            ('3/4/5/4 R MRY', 'the board needs 5 rows'),
+            ('3/3/5/4/3 R MRY', 'row 2 has 3 cells instead of 4'),
+            ('3/4/5/4/3/1 R MRY', 'more than 5 rows'),
+            ('3/4/5/4/3 X MRY', 'invalid color "X"'),
+            ('3/4/5/4/X R MRY', 'unexpected character "X"'),
+            ('3/4/5/4/3 R', 'expected'),
+            ('3/4/5/4/3 R MRY R', 'expected'),
+            ('3/4/5/4/3 RY MRY', 'invalid color "RY"'),
+            ('3/4/5/4/3 R MRYY', 'invalid variant'),
+            ('3/4/5/4/é R MRY', 'not ASCII'),
+        ]:
+            with self.assertRaisesRegex(HFENError, reason, msg=hfen): HexachromixState(hfen=hfen)
+        # Fields can be separated by any whitespace, as before.
+        for hfen in [' 3/4/5/4/3 R MRY', '3/4/5/4/3 R MRY ', '3/4/5/4/3  R\tMR']:
+            self.assertEqual(HexachromixState(hfen=hfen).hfen, '3/4/5/4/3 R ' + hfen.split()[-1], msg=hfen)
+        # Still a ValueError, as before.
+        with self.assertRaises(ValueError): HexachromixState(hfen='')
+
+        with self.assertRaises(ValueError): HexachromixState([0]*18, 0, 'MRY')
+        with self.assertRaises(ValueError): HexachromixState([13]+[0]*18, 0, 'MRY')
+        with self.assertRaises(ValueError): HexachromixState([0]*19, 6, 'MRY')
+
+    def test_bytes(self):
+        rng = Random(0)
+        for _ in range(50):
+            state = HexachromixState(variant=rng.choice(core.VARIANTS))
+            while not state.is_terminal():
+                data = state.to_bytes()
+                self.assertEqual(len(data), 11)
+                copy = HexachromixState.from_bytes(data)
+                self.assertEqual(copy.hfen, state.hfen)
+                self.assertEqual(copy, state)
+                state = state.make_move(rng.choice(state.get_legal_moves()))
+        with self.assertRaises(ValueError): HexachromixState.from_bytes(b'\0'*10)
+        with self.assertRaises(ValueError): HexachromixState.from_bytes(b'\xff'*10 + b'\0')
+        with self.assertRaises(ValueError): HexachromixState.from_bytes(b'\0'*10 + b'\3')
+
+    def test_pickle(self):
+        state = HexachromixState(hfen='GC1/BMRC/2R1c/MMYY/1BY C MR')
+        copy = pickle.loads(pickle.dumps(state))
+        self.assertEqual(copy.hfen, state.hfen)
+        self.assertEqual(hash(copy), hash(state))
+
+    def test_buffer(self):
+        state = HexachromixState(hfen='GC1/BMRC/2R1c/MMYY/1BY C MRY')
+        view = memoryview(state)
+        self.assertEqual((view.format, view.shape, view.readonly), ('B', (19,), True))
+        self.assertEqual(''.join(core.INT2CHAR[value] for value in view), 'GC-BMRC--R-cMMYY-BY')
+
     def test_get_current_team(self):
         self.assertEqual(HexachromixState(hfen='3/4/5/4/3 R MRY').get_current_team(), 'MRY')
         self.assertEqual(HexachromixState(hfen='3/4/5/4/3 Y MRY').get_current_team(), 'MRY')
@@ -81,6 +141,148 @@ class TestCore(TestCase):
         for _ in range(8): state = state.make_move(state.get_legal_moves()[0])
         self.assertEqual(state.hfen, 'Ygm/M3/5/4/3 G R')
 
+    def test_counters(self):
+        core.reset_counters()
+        state = HexachromixState()
+        state.make_move(state.get_legal_moves()[0]).has_path()
+        self.assertEqual(set(core.get_counters().values()), {0})
+        core.enable_counters()
+        try:
+            state.make_move(state.get_legal_moves()[0]).has_path()
+            state.rollout(10, seed=1)
+            counters = core.get_counters()
+            self.assertEqual(counters['make_move_allocations'], 1)
+            self.assertEqual(counters['playouts'], 10)
+            self.assertGreater(counters['legal_move_generations'], 10)
+            self.assertGreater(counters['path_checks'], 10)
+        finally:
+            core.enable_counters(False)
+            core.reset_counters()
+
+        # Counters can live in a shared buffer.
+        buffer = bytearray(8*len(core.COUNTERS))
+        core.use_counters(memoryview(buffer).cast('Q'))
+        core.enable_counters()
+        try:
+            core.add_count('nodes_expanded', 3)
+            self.assertEqual(memoryview(buffer).cast('Q')[core.COUNTERS.index('nodes_expanded')], 3)
+        finally:
+            core.enable_counters(False)
+            core.use_counters()
+        self.assertEqual(core.get_counters()['nodes_expanded'], 0)
+        with self.assertRaises(ValueError): core.use_counters(memoryview(bytearray(8)).cast('Q'))
+
+    def test_count_empty(self):
+        self.assertEqual(HexachromixState().count_empty(), 19)
+        self.assertEqual(HexachromixState(hfen='Ygm/M3/5/4/3 G R').count_empty(), 15)
+        self.assertEqual(HexachromixState(hfen='gMM/byyB/RYgGy/cmYr/mcg C MRY').count_empty(), 0)
+
+    def test_apply_undo(self):
+        state = HexachromixState(hfen='3/4/5/4/3 R MR')
+        copy = state.copy()
+        hfens = []
+        for _ in range(8):
+            hfens.append(state.hfen)
+            state.apply(state.get_legal_moves()[0])
+        self.assertEqual(state.hfen, 'Ygm/M3/5/4/3 G MR')
+        self.assertEqual(copy.hfen, '3/4/5/4/3 R MR')
+        for hfen in reversed(hfens):
+            state.undo()
+            self.assertEqual(state.hfen, hfen)
+        with self.assertRaises(IndexError): state.undo()
+
+        # Applying and undoing keeps the bitboards in sync.
+        state = HexachromixState(hfen='R2/R3/m4/4/y2 R MRY')
+        state.apply((12, 1))
+        self.assertTrue(state.has_path())
+        state.undo()
+        self.assertFalse(state.has_path_for(0))
+
+    def test_hash_and_eq(self):
+        # The same position reached by different move orders.
+        a = HexachromixState(hfen='3/4/5/4/3 R MRY').make_move((0,1)).make_move((5,2)).make_move((9,3))
+        b = HexachromixState(hfen='3/4/5/4/3 R MRY').make_move((9,1)).make_move((5,2)).make_move((0,3))
+        self.assertNotEqual(a, b)
+        b = HexachromixState(hfen='R2/4/5/4/3 Y MRY').make_move((5,2)).make_move((9,3))
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(a.key, HexachromixState(hfen=a.hfen).key)
+        self.assertEqual(len({a, b, HexachromixState()}), 2)
+
+        self.assertNotEqual(HexachromixState(hfen='3/4/5/4/3 R MRY'), HexachromixState(hfen='3/4/5/4/3 Y MRY'))
+        self.assertNotEqual(HexachromixState(hfen='3/4/5/4/3 R MRY').key, HexachromixState(hfen='3/4/5/4/3 R MR').key)
+
+        # The key is maintained incrementally.
+        state = HexachromixState(hfen='3/4/5/4/3 R R')
+        for _ in range(10):
+            state.apply(state.get_legal_moves()[-1])
+            self.assertEqual(state.key, HexachromixState(hfen=state.hfen).key)
+        for _ in range(10): state.undo()
+        self.assertEqual(state.key, HexachromixState(hfen='3/4/5/4/3 R R').key)
+
+    def test_transposition_table(self):
+        table = TranspositionTable(1)
+        self.assertEqual(table.size, 1)
+        (a, b, c) = [HexachromixState(hfen=hfen) for hfen in ['R2/4/5/4/3 Y MRY', '1R1/4/5/4/3 Y MRY', '2R/4/5/4/3 Y MRY']]
+
+        self.assertIsNone(table.get(a))
+        table.put(a, 'a', 10)
+        table.put(b, 'b', 1)
+        self.assertEqual(table.get(a), 'a')
+        self.assertEqual(table.get(HexachromixState(hfen='R2/4/5/4/3 Y MRY')), 'a')
+        self.assertEqual(table.get(b), 'b')
+        self.assertEqual(len(table), 2)
+
+        # The low-priority entry is replaced; the high-priority one is kept.
+        table.put(c, 'c', 5)
+        self.assertEqual(table.get(a), 'a')
+        self.assertIsNone(table.get(b))
+        self.assertEqual(table.get(c), 'c')
+        # A higher priority takes the preferred slot and demotes the old entry.
+        table.put(b, 'b', 20)
+        self.assertEqual(table.get(b), 'b')
+        self.assertEqual(table.get(a), 'a')
+        self.assertNotIn(c, table)
+
+        self.assertEqual((table.hits, table.misses, table.replacements), (7, 2, 2))
+        table.clear()
+        self.assertEqual(len(table), 0)
+
+    def test_symmetries(self):
+        self.assertEqual([len(list(HexachromixState(variant=v).symmetries())) for v in ['MRY','MR','R']], [4, 6, 12])
+
+        rng = Random(1)
+        for variant in ['MRY','MR','R']:
+            for _ in range(50):
+                state = HexachromixState([rng.randrange(13) for _ in range(19)], rng.randrange(6), variant)
+                (canonical, symmetry) = state.canonical()
+                self.assertEqual(symmetry.apply(state), canonical)
+                for (other, symmetry) in state.symmetries():
+                    # Paths, moves and teams carry over.
+                    for color in range(6):
+                        self.assertEqual(other.has_path_for((color+symmetry.shift)%6), state.has_path_for(color))
+                    self.assertEqual(
+                        sorted(symmetry.map_move(move) for move in state.get_legal_moves()),
+                        sorted(other.get_legal_moves()),
+                    )
+                    for move in state.get_legal_moves():
+                        self.assertEqual(symmetry.unmap_move(symmetry.map_move(move)), move)
+                        self.assertEqual(symmetry.apply(state.make_move(move)), other.make_move(symmetry.map_move(move)))
+                    self.assertEqual(symmetry.inverse.apply(other), state)
+                    # Every equivalent state has the same canonical form.
+                    self.assertEqual(other.canonical()[0], canonical)
+
+        with self.assertRaises(ValueError): Symmetry(1, 0)
+        with self.assertRaises(ValueError): Symmetry(1, 1).apply(HexachromixState(variant='MRY'))
+
+    def test_get_unique_moves(self):
+        # The empty board only has 180 degree rotations that keep R to move, which pair up every cell but the center.
+        self.assertEqual(len(HexachromixState(hfen='3/4/5/4/3 R MRY').get_unique_moves()), 10)
+        self.assertEqual(len(HexachromixState(hfen='R2/4/5/4/3 Y MRY').get_unique_moves()), 18)
+
+    def test_invalid_variant(self):
+        with self.assertRaises(ValueError): HexachromixState(hfen='3/4/5/4/3 R XYZ')
+
     def test_is_terminal(self):
         self.assertTrue(HexachromixState(hfen='R2/R3/m4/R3/y2 Y MRY').is_terminal())
         self.assertTrue(HexachromixState(hfen='3/4/yGcyG/4/3 C MR').is_terminal())
@@ -101,3 +303,80 @@ class TestCore(TestCase):
     def test_has_path(self):
         self.assertTrue(HexachromixState(hfen='RRR/RRRR/RRRRR/RRRR/RRR Y MRY').has_path())
         self.assertFalse(HexachromixState(hfen='RRR/RRRR/RRRRR/RRRR/RRR R MRY').has_path())
+
+    def test_has_path_matches_bfs(self):
+        rng = Random(0)
+        for _ in range(2000):
+            # Vary the density so that both connected and disconnected boards come up.
+            density = rng.random()
+            board = [rng.randrange(1,13) if rng.random() < density else 0 for _ in range(19)]
+            state = HexachromixState(board, rng.randrange(6), 'MRY')
+            for color in range(6):
+                self.assertEqual(state.has_path_for(color), state._has_path_bfs(color), f'{state.hfen} color={color}')
+            self.assertEqual(state.has_path(), state._has_path_bfs((COLORS.index(state.color)-1)%6), state.hfen)
+
+    def test_suggest_move(self):
+        (move, state) = HexachromixState(hfen='R2/R3/m4/4/y2 R MRY').suggest_move()
+        self.assertEqual(move, (12, 1))
+        self.assertTrue(state.has_path())
+
+    def test_rollout(self):
+        state = HexachromixState(hfen='3/4/5/4/3 R MRY')
+        self.assertEqual(state.rollout(500, seed=7), state.rollout(500, seed=7))
+        rewards = state.rollout(500, seed=7)
+        self.assertEqual(set(rewards), {'MRY','GCB'})
+        self.assertLessEqual(sum(rewards.values()), 500)
+
+        # R can win immediately, and the policy always takes a winning move.
+        self.assertEqual(HexachromixState(hfen='R2/R3/m4/4/y2 R MR').rollout(100, seed=1), {'MR':100, 'YG':0, 'CB':0})
+        # Terminal states are scored without playing.
+        self.assertEqual(HexachromixState(hfen='RRR/RRRR/RRRRR/RRRR/RRR Y R').rollout(10)['R'], 10)
+        self.assertEqual(sum(HexachromixState(hfen='RRR/RRRR/RRRRR/RRRR/RRR R R').rollout(10).values()), 0)
+
+    def test_rollout_matches_suggest_move(self):
+        state = HexachromixState(hfen='3/4/5/4/3 R MRY')
+        n = 2000
+        native = state.rollout(n, seed=3)
+        seed(3)
+        python = {'MRY':0, 'GCB':0}
+        for _ in range(n):
+            s = state
+            while not s.is_terminal():
+                (_, s) = s.suggest_move()
+            if s.has_path():
+                python[s.get_result().split()[1]] += 1
+        for team in python:
+            self.assertAlmostEqual(native[team]/n, python[team]/n, delta=0.05)
+
+    @skipUnless(numpy, 'numpy is not installed')
+    def test_batch(self):
+        rng = Random(2)
+        rows = []
+        for _ in range(500):
+            density = rng.random()
+            rows.append(([rng.randrange(1,13) if rng.random() < density else 0 for _ in range(19)], rng.randrange(6)))
+        boards = numpy.array([board for (board,_) in rows], dtype='uint8')
+        players = numpy.array([player for (_,player) in rows], dtype='uint8')
+
+        legal = core.batch_legal_moves(boards, players)
+        has_path = core.batch_has_path(boards, players)
+        terminal = core.batch_is_terminal(boards, players)
+        cells = numpy.array([numpy.flatnonzero(row)[0] if row.any() else 0 for row in legal], dtype='uint8')
+        playable = legal.any(axis=1)
+        (new_boards, new_players) = core.batch_make_moves(boards[playable], players[playable], cells[playable])
+
+        k = 0
+        for (n, (board, player)) in enumerate(rows):
+            state = HexachromixState(board, player, 'MRY')
+            moves = state.get_legal_moves()
+            self.assertEqual(sorted(i for (i,_) in moves), list(numpy.flatnonzero(legal[n])))
+            self.assertEqual(has_path[n], state.has_path())
+            self.assertEqual(terminal[n], state.is_terminal())
+            if moves:
+                child = state.make_move(moves[0])
+                self.assertEqual(child, HexachromixState(list(new_boards[k]), new_players[k], 'MRY'))
+                k += 1
+
+        with self.assertRaises(ValueError): core.batch_legal_moves(numpy.zeros((2,18), dtype='uint8'), numpy.zeros(2, dtype='uint8'))
+        with self.assertRaises(ValueError): core.batch_legal_moves(numpy.full((2,19), 13, dtype='uint8'), numpy.zeros(2, dtype='uint8'))
+        with self.assertRaises(ValueError): core.batch_make_moves(numpy.ones((1,19), dtype='uint8'), numpy.zeros(1, dtype='uint8'), numpy.zeros(1, dtype='uint8'))
@@ -0,0 +1,25 @@
+from unittest import TestCase
+from hexachromix import metrics
+
+class TestMetrics(TestCase):
+    def test_histogram(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency.', [0.1, 1], label='path')
+        for value in [0.05, 0.5, 5]:
+            histogram.observe(value, '/best/')
+        self.assertEqual(histogram.render(), [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{path="/best/",le="0.1"} 1',
+            'latency_seconds_bucket{path="/best/",le="1"} 2',
+            'latency_seconds_bucket{path="/best/",le="+Inf"} 3',
+            'latency_seconds_sum{path="/best/"} 5.55',
+            'latency_seconds_count{path="/best/"} 3',
+        ])
+
+    def test_metric(self):
+        self.assertEqual(metrics.metric('queue_depth', 'gauge', 'Queue depth.', {None:2}), ['# HELP queue_depth Queue depth.', '# TYPE queue_depth gauge', 'queue_depth 2'])
+        self.assertEqual(metrics.metric('rss', 'gauge', 'RSS.', {'api':1}, label='process')[2], 'rss{process="api"} 1')
+
+    def test_total_counters(self):
+        slots = [1, 2, 3, 4, 5] * 2
+        self.assertEqual(list(metrics.total_counters(slots).values()), [2, 4, 6, 8, 10])
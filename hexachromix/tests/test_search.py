@@ -0,0 +1,104 @@
+from unittest import TestCase
+from queue import Queue
+from threading import Event
+from hexachromix import search
+from hexachromix.core import HexachromixState
+from hexachromix import core
+from hexachromix.tree import SearchTree
+
+class TestSearch(TestCase):
+    def test_analysis(self):
+        children = search.analysis('3/4/5/4/3 R MRY', max_iterations=200, seed=1)
+        self.assertEqual(len(children), 19)
+        self.assertEqual(sum(child['visits'] for child in children), 200)
+        self.assertEqual(children, search.analysis('3/4/5/4/3 R MRY', max_iterations=200, seed=1))
+
+    def test_counts_expanded_nodes(self):
+        core.reset_counters()
+        core.enable_counters()
+        try:
+            search.analysis('3/4/5/4/3 R MRY', max_iterations=200, seed=1)
+            self.assertEqual(core.get_counters()['nodes_expanded'], 200)
+            search.best('3/4/5/4/3 R MRY', max_iterations=50)
+            self.assertEqual(core.get_counters()['nodes_expanded'], 250)
+        finally:
+            core.enable_counters(False)
+            core.reset_counters()
+
+    def test_merge(self):
+        merged = search.merge([
+            [{'hfen':'a', 'visits':3, 'reward':1.0}, {'hfen':'b', 'visits':1, 'reward':0.0}],
+            [{'hfen':'b', 'visits':3, 'reward':0.5}, {'hfen':'a', 'visits':1, 'reward':0.0}],
+            [{'hfen':'c', 'visits':0, 'reward':0.0}],
+        ])
+        self.assertEqual(merged, [
+            {'hfen':'a', 'visits':4, 'reward':0.75},
+            {'hfen':'b', 'visits':4, 'reward':0.375},
+            {'hfen':'c', 'visits':0, 'reward':0},
+        ])
+        self.assertEqual(search.best_of(merged), 'a')
+
+    def test_parallel_analysis(self):
+        children = search.parallel_analysis('3/4/5/4/3 R MRY', 2, max_iterations=100)
+        self.assertEqual(len(children), 19)
+        self.assertEqual(sum(child['visits'] for child in children), 200)
+
+    def test_search_tree(self):
+        tree = SearchTree(HexachromixState(), 1, 1)
+        with self.assertRaises(ValueError): tree.best()
+        self.assertEqual(tree.search(max_iterations=100), 100)
+        self.assertEqual(tree.search(max_iterations=50), 50)
+        self.assertEqual(tree.get_visits(), 150)
+        children = tree.get_children()
+        self.assertEqual(sum(child['visits'] for child in children), 150)
+        self.assertIn(tree.best().hfen, [child['hfen'] for child in children])
+        self.assertEqual(tree.best('move'), tree.best('node').get_move())
+
+    def test_search_tree_reuse(self):
+        tree = SearchTree(HexachromixState(), 1, 1)
+        tree.search(max_iterations=2000)
+        self.assertEqual(tree.get_nodes(), 2001)
+
+        # The played move's subtree is kept, with its statistics.
+        node = tree.best('node')
+        (move, visits) = (node.get_move(), node.get_visits())
+        tree.advance(move)
+        self.assertEqual(tree.get_state(), HexachromixState().make_move(move))
+        self.assertEqual(tree.get_visits(), visits)
+        self.assertEqual(tree.get_nodes(), visits)
+
+        # Likewise for a move given as the resulting state.
+        node = next(iter(tree.get_root().get_children().values()))
+        tree.advance_to(node.get_state())
+        self.assertEqual(tree.get_visits(), node.get_visits())
+
+        # A move that wasn't expanded starts a new tree.
+        tree = SearchTree(HexachromixState(), 1, 1)
+        tree.advance((0,1))
+        self.assertEqual((tree.get_visits(), tree.get_nodes()), (0, 1))
+        with self.assertRaises(ValueError): tree.advance((19,1))
+        with self.assertRaises(ValueError): tree.search(max_iterations=-1)
+        # Finished games can't be searched.
+        with self.assertRaises(ValueError): SearchTree(HexachromixState(hfen='RRR/RRRR/RRRRR/RRRR/RRR Y MRY')).search(max_iterations=10)
+        tree.advance_to(tree.get_state().make_move((1,2)))
+        self.assertEqual((tree.get_state(), tree.get_nodes()), (HexachromixState().make_move((0,1)).make_move((1,2)), 1))
+
+        # States that aren't a move away are rejected, and the tree is kept.
+        tree.search(max_iterations=100)
+        for state in [HexachromixState(), tree.get_state(), tree.get_state().make_move((2,3)).make_move((3,4))]:
+            with self.assertRaises(ValueError): tree.advance_to(state)
+        self.assertEqual(tree.get_visits(), 100)
+
+    def test_stream_analysis(self):
+        updates = Queue()
+        search.stream_analysis('3/4/5/4/3 R MRY', updates, Event(), max_iterations=250, every_iterations=100)
+        totals = []
+        while (children := updates.get()) is not None:
+            totals.append(sum(child['visits'] for child in children))
+        self.assertEqual(totals, [100, 200, 250])
+
+        # Stopping ends the stream after the current slice.
+        stop = Event()
+        stop.set()
+        search.stream_analysis('3/4/5/4/3 R MRY', updates, stop, max_iterations=250, every_iterations=100)
+        self.assertIsNone(updates.get())
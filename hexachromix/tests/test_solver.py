@@ -0,0 +1,74 @@
+from unittest import TestCase
+from random import Random
+from hexachromix.core import HexachromixState
+from hexachromix.solver import Solver, decisive, WIN, DRAW, LOSS
+
+def minimax(state, plies, team, horizon):
+    """Plain minimax, as a reference for the solver's searches."""
+    values = []
+    for move in state.get_legal_moves():
+        child = state.make_move(move)
+        if child.has_path(): value = WIN if state.get_current_team() == team else LOSS
+        elif child.is_terminal(): value = DRAW
+        elif plies == 1: value = horizon
+        else: value = minimax(child, plies-1, team, horizon)
+        values.append(value)
+    return max(values) if state.get_current_team() == team else min(values)
+
+def endgames(n, seed=0):
+    """Positions a few moves from the end of random games."""
+    rng = Random(seed)
+    for i in range(n):
+        state = HexachromixState(variant=['MRY','MR','R'][i%3])
+        states = []
+        while not state.is_terminal():
+            states.append(state)
+            state = state.make_move(rng.choice(state.get_legal_moves()))
+        yield states[max(0, len(states) - rng.randint(2, 8))]
+
+class TestSolver(TestCase):
+    def test_search(self):
+        solver = Solver(1<<12)
+        solver.end_time = None
+        for state in endgames(15):
+            solver.team = state.get_current_team()
+            for horizon in (LOSS, WIN):
+                # Iterative deepening, so the transposition table carries over between depths.
+                for plies in range(1, 5):
+                    (value, move) = solver.search(state, plies, LOSS, WIN, horizon)
+                    self.assertEqual(value, minimax(state, plies, solver.team, horizon))
+
+    def test_solve(self):
+        solver = Solver(1<<12)
+        solved = 0
+        for state in endgames(30, seed=1):
+            solution = solver.solve(state, max_plies=6)
+            if solution['result'] is None:
+                continue
+            solved += 1
+            # The move guarantees the result.
+            value = {'win':WIN, 'draw':DRAW, 'loss':LOSS}[solution['result']]
+            self.assertIn(solution['move'], state.get_legal_moves())
+            child = state.make_move(solution['move'])
+            self.assertEqual(child.hfen, solution['hfen'])
+            if child.has_path():
+                self.assertEqual(value, WIN)
+            elif not child.is_terminal() and solution['plies'] > 1:
+                self.assertGreaterEqual(minimax(child, solution['plies']-1, state.get_current_team(), LOSS), value)
+        self.assertGreater(solved, 0)
+
+        with self.assertRaises(ValueError): solver.solve(HexachromixState(hfen='R2/R3/R4/R3/R2 Y R'))
+        with self.assertRaises(ValueError): solver.solve(HexachromixState(), max_plies=0)
+
+    def test_decisive(self):
+        state = HexachromixState(variant='MRY')
+        self.assertTrue(decisive({'result':'win'}, state))
+        self.assertTrue(decisive({'result':'draw'}, state))
+        self.assertFalse(decisive({'result':'loss'}, state))
+        self.assertFalse(decisive({'result':None}, state))
+        # With more than two teams, only wins are proven.
+        for variant in ['MR','R']:
+            state = HexachromixState(variant=variant)
+            self.assertTrue(decisive({'result':'win'}, state))
+            self.assertFalse(decisive({'result':'draw'}, state))
+            self.assertFalse(decisive({'result':'loss'}, state))
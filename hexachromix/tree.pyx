@@ -0,0 +1,380 @@
+# distutils: language=c++
+# cython: language_level=3
+# cython: profile=False
+
+"""The same search as multimcts.MCTS, but the tree outlives each call to search.
+This lets a search be run in slices (reporting between them) and resumed later,
+and lets the subtree of the move actually played be reused for the next search.
+"""
+
+from time import time
+from random import shuffle, choice
+from typing import Union, List
+
+cimport cython
+from libc.math cimport log, sqrt, INFINITY
+from libcpp.string cimport string
+from libcpp.map cimport map
+from libcpp.pair cimport pair
+
+from .core import add_count
+
+
+cdef class Node:
+    """A game state node in the search tree. See multimcts.mcts.Node, which this mirrors."""
+    cdef state, move, children, remaining_moves
+    cdef Node parent
+    cdef string team
+    cdef map[string,double] rewards, rave_rewards
+    cdef unsigned int visits, rave_visits
+    cdef bint is_terminal, is_fully_expanded
+    cdef double sqrtlog_visits, invsqrt_visits, avg_reward, avg_rave_reward
+
+    def __init__(self, state, parent:Node=None, move=None):
+        self.state = state
+        self.parent = parent
+        self.move = move
+
+        self.children = {}
+        self.visits = 0
+        self.rave_visits = 0
+        self.rewards = map[string,double]()
+        self.rave_rewards = map[string,double]()
+        self.is_terminal = self.state.is_terminal()
+        self.is_fully_expanded = self.is_terminal
+        if self.is_fully_expanded:
+            self.remaining_moves = []
+        else:
+            self.remaining_moves = self.state.get_legal_moves()
+            shuffle(self.remaining_moves)
+
+        # The following are cached for performance.
+        self.team = str(self.state.get_current_team()).encode()
+        if self.parent is not None:
+            self.rewards[self.parent.team] = 0
+            self.rave_rewards[self.parent.team] = 0
+        self.sqrtlog_visits = 0
+        self.invsqrt_visits = 0
+        self.avg_reward = 0
+        self.avg_rave_reward = 0
+
+    def get_state(self): return self.state
+    def get_team(self) -> str: return self.team.decode()
+    def get_move(self): return self.move
+
+    def get_parent(self) -> Node: return self.parent
+    def get_children(self) -> dict: return self.children
+
+    def get_visits(self) -> int: return self.visits
+    def get_rewards(self) -> dict: return {item.first.decode():item.second for item in self.rewards}
+    def get_avg_reward(self) -> float: return self.avg_reward
+
+    def get_rave_visits(self) -> int: return self.rave_visits
+    def get_rave_rewards(self) -> dict: return {item.first.decode():item.second for item in self.rave_rewards}
+    def get_avg_rave_reward(self) -> float: return self.avg_rave_reward
+
+    @cython.cdivision(True)
+    cdef void visit(self, map[string,double] crewards, set moves):
+        """Update this node's visits and rewards, and cache some variables for more efficient score calculation."""
+        self.visits += 1
+
+        self.sqrtlog_visits = sqrtlog(self.visits)
+        self.invsqrt_visits = invsqrt(self.visits)
+
+        # Update regular rewards.
+        cdef pair[string,double] item
+        cdef double total_reward = 0
+        for item in crewards:
+            if self.rewards.count(item.first) == 0:
+                self.rewards[item.first] = 0
+            self.rewards[item.first] += item.second
+            total_reward += self.rewards[item.first]
+        if self.parent is not None:
+            # Average reward: (reward for my parent's team - rewards for all other teams) / num visits to this node
+            self.avg_reward = ((2*self.rewards[self.parent.team]) - total_reward) / self.visits
+
+        # Update RAVE rewards.
+        if len(moves) == 0:
+            return
+        cdef unsigned int rave_visits = 0
+        cdef double total_rave_reward = 0
+        for move in list(self.children.keys()) + self.remaining_moves:
+            if move in moves:
+                rave_visits += 1
+        if rave_visits > 0:
+            self.rave_visits += rave_visits
+            for item in crewards:
+                if self.rave_rewards.count(item.first) == 0:
+                    self.rave_rewards[item.first] = 0
+                self.rave_rewards[item.first] += rave_visits * item.second
+                total_rave_reward += self.rave_rewards[item.first]
+            if self.parent is not None:
+                self.avg_rave_reward = ((2*self.rave_rewards[self.parent.team]) - total_rave_reward) / self.rave_visits
+
+    cpdef double uncertainty(self, double exploration_bias):
+        """The exploration term of the UCT formula: C * sqrt(ln(N) / n)"""
+        return exploration_bias * self.parent.sqrtlog_visits * self.invsqrt_visits
+
+    @cython.cdivision(True)
+    cpdef double rave_ratio(self, double rave_bias):
+        """Determines the relative weight of RAVE rewards in the final score calculation."""
+        if self.rave_visits == 0 or rave_bias == 0:
+            return 0
+        elif self.visits == 0:
+            return 1
+        return rave_bias / (rave_bias + self.visits)
+
+    cpdef double base_score(self, double rave_bias):
+        if rave_bias == 0: return self.avg_reward
+        cdef double rave_ratio = self.rave_ratio(rave_bias)
+        return ((1-rave_ratio) * self.avg_reward) + (rave_ratio * self.avg_rave_reward)
+
+    cpdef double score(self, double exploration_bias, double rave_bias):
+        return self.base_score(rave_bias) + self.uncertainty(exploration_bias)
+
+    cdef Node best_child(self, double exploration_bias, double rave_bias, double pruning_bias):
+        cdef Node child
+        cdef Node best_child = next(iter(self.children.values()))
+        cdef double score
+        cdef double best_score = -INFINITY
+
+        # Find the best child.
+        lessers = []
+        for move, child in self.children.items():
+            score = child.score(exploration_bias, rave_bias)
+            lessers.append((child, move, score))
+            if score > best_score:
+                best_score = score
+                best_child = child
+
+        # Prune any child whose optimistic estimate (UCB) is much worse than the best child's pessimistic estimate (LCB).
+        cdef double best_lcb, pruning_threshold
+        if pruning_bias > 0:
+            best_lcb = best_score - (2 * best_child.uncertainty(exploration_bias))
+            for (child, move, score) in lessers:
+                pruning_threshold = best_lcb - (child.uncertainty(exploration_bias) * (1-pruning_bias))
+                if score <= pruning_threshold:
+                    del self.children[move]
+
+        return best_child
+
+
+cdef class SearchTree:
+    """An MCTS search rooted at one state, which can be continued with more calls to search.
+    Args:
+        state: The game state to search from.
+        exploration_bias, rave_bias, pruning_bias (float): As for multimcts.MCTS.
+    """
+    cdef double _exploration_bias, _rave_bias, _pruning_bias
+    cdef Node root
+    cdef unsigned long n_nodes
+
+    def __init__(self, state, exploration_bias:float=1.414, rave_bias:float=0, pruning_bias:float=0):
+        if exploration_bias < 0: raise ValueError('Invalid exploration_bias. Must be non-negative.')
+        if rave_bias < 0: raise ValueError('Invalid rave_bias. Must be non-negative.')
+        if pruning_bias < 0 or pruning_bias > 1: raise ValueError('Invalid pruning_bias. Must be in range [0,1].')
+
+        self._exploration_bias = exploration_bias
+        self._rave_bias = rave_bias
+        self._pruning_bias = pruning_bias
+        self.root = Node(state)
+        self.n_nodes = 1
+
+    @property
+    def exploration_bias(self) -> float: return self._exploration_bias
+    @property
+    def rave_bias(self) -> float: return self._rave_bias
+    @property
+    def pruning_bias(self) -> float: return self._pruning_bias
+
+    def get_root(self) -> Node: return self.root
+    def get_state(self): return self.root.state
+    def get_visits(self) -> int: return self.root.visits
+    def get_nodes(self) -> int:
+        """Number of nodes in the tree. Subtrees removed by pruning are still counted, so this is an upper bound."""
+        return self.n_nodes
+
+    def advance(self, move):
+        """Play a move from the root. Its subtree (if any) becomes the new root and the rest of the tree is released."""
+        cdef Node child = self.root.children.pop(move, None)
+        if child is None:
+            if move not in self.root.state.get_legal_moves():
+                raise ValueError(f'Illegal move {move}.')
+            self.n_nodes -= release(self.root)
+            self.root = Node(self.root.state.make_move(move))
+            self.n_nodes += 1
+        else:
+            child.parent = None
+            self.n_nodes -= release(self.root)
+            self.root = child
+
+    def advance_to(self, state):
+        """Play the move from the root that leads to the given state, as advance. Raises ValueError if no legal move does."""
+        for move, child in self.root.children.items():
+            if (<Node>child).state == state:
+                self.advance(move)
+                return
+        root_state = self.root.state
+        for move in root_state.get_legal_moves():
+            if root_state.make_move(move) == state:
+                self.advance(move)
+                return
+        raise ValueError(f'No legal move leads to {state}.')
+
+    def search(self, *, max_iterations:int=None, max_time:Union[int,float]=None) -> int:
+        """Grow the tree until one of the limits is reached. Returns the number of iterations performed."""
+        if max_iterations is None and max_time is None:
+            raise ValueError('At least one of [max_iterations,max_time] is required.')
+        if max_iterations is not None and max_iterations < 0:
+            raise ValueError('Invalid max_iterations. Must be non-negative.')
+        if self.root.is_terminal:
+            raise ValueError('The game is over.')
+
+        cdef unsigned int end_iteration
+        if max_iterations is not None:
+            end_iteration = max_iterations
+        cdef double end_time
+        if max_time is not None:
+            end_time = time() + max_time
+
+        cdef unsigned int i = 0
+        cdef unsigned long n_nodes = self.n_nodes
+        while max_iterations is None or i < end_iteration:
+            self.execute_round(self.root)
+            i += 1
+            if max_time is not None and end_time <= time():
+                break
+        add_count('nodes_expanded', self.n_nodes - n_nodes)
+        return i
+
+    def best(self, return_type:str="state"):
+        """The best move found so far (the child with the highest average reward), like multimcts.MCTS.search."""
+        if return_type not in {'state','move','node'}:
+            raise ValueError(f'Invalid return_type "{return_type}" must be one of {{"state","move","node"}}')
+        if len(self.root.children) == 0:
+            raise ValueError('The tree has no children. Search first.')
+        cdef Node best = self.root.best_child(0, 0, 0)
+        if return_type == "state":
+            return best.state
+        elif return_type == "move":
+            return best.move
+        return best
+
+    def get_children(self) -> List[dict]:
+        """Info about each of the root's children (the resulting HFEN, visits and average reward), sorted by visits and reward."""
+        cdef Node n
+        children = [
+            {
+                'hfen': n.state.hfen,
+                'visits': n.visits,
+                'reward': n.avg_reward,
+            }
+            for n in self.root.children.values()
+        ]
+        children.sort(key=lambda n:(n['visits'],n['reward']), reverse=True)
+        return children
+
+    cdef void execute_round(self, Node node):
+        """Step 1-2: Selection/Expansion"""
+        node = self.select(node)
+
+        """Step 3: Simulation"""
+        cdef map[string,double] crewards
+        cdef set moves
+        (crewards, moves) = simulate(node)
+
+        """Step 4: Backpropagation"""
+        if self._rave_bias == 0:
+            moves = set()
+        backpropagate(node, crewards, moves)
+
+    cdef Node select(self, Node node):
+        while not node.is_terminal:
+            if node.is_fully_expanded:
+                node = node.best_child(self._exploration_bias, self._rave_bias, self._pruning_bias)
+            else:
+                self.n_nodes += 1
+                return expand(node)
+        return node
+
+
+cdef unsigned long release(Node node):
+    """Unlink a subtree so it is freed right away rather than by the cycle collector. Returns its size."""
+    cdef unsigned long n = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        n += 1
+        stack.extend(node.children.values())
+        node.children = {}
+        node.parent = None
+    return n
+
+
+cdef Node expand(Node node):
+    move = node.remaining_moves.pop()
+    if len(node.remaining_moves) == 0:
+        node.is_fully_expanded = True
+    cdef Node child = Node(state=node.state.make_move(move), parent=node, move=move)
+    node.children[move] = child
+    return child
+
+cdef tuple simulate(Node node):
+    cdef set moves = set()
+    state = node.state
+
+    if node.is_terminal:
+        # If terminal, no simulation needed. Just get the reward.
+        reward = state.get_reward()
+        if not isinstance(reward, dict):
+            reward = {node.parent.state.get_current_team(): reward}
+    else:
+        # Do the rollout.
+        if callable(getattr(state, 'suggest_move', False)):
+            while not state.is_terminal():
+                prev_state = state
+                (move, state) = state.suggest_move()
+                moves.add(move)
+        else:
+            while not state.is_terminal():
+                prev_state = state
+                move = choice(state.get_legal_moves())
+                moves.add(move)
+                state = state.make_move(move)
+        reward = state.get_reward()
+        if not isinstance(reward, dict):
+            reward = {prev_state.get_current_team(): reward}
+
+    # Convert rewards from Python dict to C map.
+    cdef map[string,double] crewards = map[string,double]()
+    for team in reward:
+        if reward[team] != 0:
+            crewards[str(team).encode()] = float(reward[team])
+
+    return (crewards, moves)
+
+cdef void backpropagate(Node node, map[string,double] crewards, set moves):
+    while node is not None:
+        node.visit(crewards, moves)
+        node = node.parent
+
+
+# Cache some math to speed up Node visits.
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double sqrtlog(unsigned int x):
+    return SQRTLOG[x] if x < CACHE_MAX else sqrt(log(x))
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef double invsqrt(unsigned int x):
+    return INVSQRT[x] if x < CACHE_MAX else 1 / sqrt(x)
+
+cdef unsigned int CACHE_MAX = 10000
+cdef double[10000] SQRTLOG, INVSQRT
+cdef unsigned int x = 0
+SQRTLOG[0] = 0
+INVSQRT[0] = 0
+for x in range(1,CACHE_MAX):
+    SQRTLOG[x] = sqrt(log(x))
+    INVSQRT[x] = 1 / sqrt(x)
@@ -15,11 +15,16 @@ setup(
         'uvicorn',
         'psutil',
     ],
+    extras_require={
+        'batch': ['numpy'],
+        'test': ['httpx'], # For fastapi.testclient.
+    },
     entry_points={
         'console_scripts': ['hexachromix-cli=hexachromix.cli:main'],
     },
     ext_modules=cythonize([
         Extension('hexachromix.core', ['hexachromix/core.pyx']),
+        Extension('hexachromix.tree', ['hexachromix/tree.pyx']),
     ]),
-    package_data={'hexachromix': ['core.pyx']},
+    package_data={'hexachromix': ['core.pyx', 'tree.pyx']},
 )